@@ -0,0 +1,75 @@
+"""
+Cold-start import time benchmark for the lambdas in this directory.
+
+Runs each lambda file in a fresh interpreter with 'python -X importtime'
+and reports the modules it imports beyond those of a bare interpreter,
+with their cumulative import time.  Each file is run several times and
+the median is reported, so run it on an otherwise idle machine and
+compare numbers from the same machine and Python version.
+
+Usage:
+    python bench_importtime.py [--runs N] [--top N] [lambda file ...]
+
+Defaults to kdf-transform.py and function.py.  Exits non-zero if a
+lambda cannot be imported, e.g. because a dependency is not installed.
+
+Only module level imports are measured.  function.py imports its SigV4
+signer, which imports boto3 when it is installed (as in the Lambda
+runtime), on its first invocation, unless OSIS_SIGV4=false.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LAMBDAS = ['kdf-transform.py', 'function.py']
+
+
+def importtime(args):
+    """
+    Run python -X importtime with 'args' and return [(name, cumulative us)]
+    for the top level imports, in import order.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nested imports are indented below the module importing them
+        if not name.startswith('  '):
+            imports.append((name.strip(), int(cumulative)))
+    if result.returncode:
+        sys.exit('{} failed:\n{}'.format(' '.join(args), result.stderr.splitlines()[-1]))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('lambdas', nargs='*', default=DEFAULT_LAMBDAS)
+    args = parser.parse_args()
+
+    baseline = set(name for name, _ in importtime(['-c', 'pass']))
+    for path in args.lambdas:
+        path = os.path.join(HERE, path)
+        runs = [dict((name, us) for name, us in importtime([path]) if name not in baseline)
+                for _ in range(args.runs)]
+        modules = dict((name, statistics.median(run.get(name, 0) for run in runs))
+                       for name in runs[0])
+        totals = [sum(run.values()) for run in runs]
+        print('{}: {:.1f} ms median over {} runs (min {:.1f}, max {:.1f})'.format(
+            os.path.basename(path), statistics.median(totals) / 1000, args.runs,
+            min(totals) / 1000, max(totals) / 1000))
+        for name, us in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+            print('  {:>9.1f} ms  {}'.format(us / 1000, name))
+
+
+if __name__ == '__main__':
+    main()
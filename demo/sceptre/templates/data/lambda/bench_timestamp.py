@@ -0,0 +1,50 @@
+"""
+Micro-benchmark of the per-event timestamp formatting in kdf-transform.py.
+
+Compares datetime.fromtimestamp().isoformat() with UtcTimestampFormatter
+on log event timestamps spread over a few seconds, as in a typical
+CloudWatch batch, and checks that both give the same UTC strings.
+
+Usage:
+    python bench_timestamp.py [number of events]
+"""
+import importlib.util
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+
+
+def load_transform():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kdf-transform.py')
+    spec = importlib.util.spec_from_file_location('kdf_transform', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def isoformat_utc(epoch_ms):
+    dt = datetime.fromtimestamp(epoch_ms / 1000, timezone.utc)
+    return dt.replace(tzinfo=None).isoformat() + 'Z'
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    start = 1694703576000
+    # about 3 events per millisecond over a few seconds
+    timestamps = [start + i // 3 for i in range(count)]
+
+    formatter = load_transform().UtcTimestampFormatter()
+    mismatches = [ts for ts in timestamps if formatter(ts) != isoformat_utc(ts)]
+    if mismatches:
+        sys.exit('formatter output differs for {} timestamps, e.g. {}'.format(
+            len(mismatches), mismatches[0]))
+
+    for name, func in (('isoformat', isoformat_utc), ('cached', formatter)):
+        elapsed = min(timeit.repeat(lambda: [func(ts) for ts in timestamps],
+                                    number=1, repeat=5))
+        print('{:10} {:8.0f} ns/event'.format(name, elapsed / count * 1e9))
+
+
+if __name__ == '__main__':
+    main()
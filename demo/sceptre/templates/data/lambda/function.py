@@ -70,21 +70,64 @@ import base64
 import gzip
 import json
 import logging
-import json
-import jmespath
+import os
 import requests
-from datetime import datetime
-from requests_auth_aws_sigv4 import AWSSigV4
-import boto3
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
 
+# OpenSearch Ingestion pipeline endpoint: a host name, or a full URL such as
+# http://localhost:8080 to test against a local server
+INGESTION_ENDPOINT = os.environ.get('OSIS_ENDPOINT', '{OpenSearch Pipeline Endpoint}')
+INGESTION_PATH = os.environ.get('OSIS_PATH', '/logs/ingest')
+# OSIS rejects requests over 10 MB; keep each (uncompressed) body below it
+MAX_REQUEST_BYTES = int(os.environ.get('OSIS_MAX_REQUEST_BYTES', 9 * 1024 * 1024))
+# the pipeline's http source must be configured with "compression: gzip"
+GZIP_REQUESTS = os.environ.get('OSIS_GZIP', 'true').lower() == 'true'
+# set to "false" for a local server that does not check signatures (this
+# also skips importing the signer and, with it, boto3)
+SIGN_REQUESTS = os.environ.get('OSIS_SIGV4', 'true').lower() == 'true'
+MAX_RETRIES = int(os.environ.get('OSIS_MAX_RETRIES', 5))
+RETRY_BACKOFF = float(os.environ.get('OSIS_RETRY_BACKOFF', 0.5))
+REQUEST_TIMEOUT = float(os.environ.get('OSIS_REQUEST_TIMEOUT', 30))
+
+# kept for the life of the Lambda container, so warm invocations reuse
+# open connections
+_session = None
+
+
+class UtcTimestampFormatter:
+    """Format CloudWatch epoch millisecond timestamps as UTC ISO 8601,
+    formatting the date and time up to the second only when it changes.
+    """
+
+    def __init__(self):
+        self._cached = (None, None)
+
+    def __call__(self, epoch_ms):
+        if type(epoch_ms) is not int:
+            dt = datetime.fromtimestamp(epoch_ms / 1000, timezone.utc)
+            return dt.replace(tzinfo=None).isoformat() + 'Z'
+        seconds, ms = divmod(epoch_ms, 1000)
+        cached_seconds, prefix = self._cached
+        if seconds != cached_seconds:
+            prefix = datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+            self._cached = (seconds, prefix)
+        if ms:
+            return '%s.%03d000Z' % (prefix, ms)
+        return prefix + 'Z'
+
+
+format_timestamp = UtcTimestampFormatter()
+
 
 def lambda_handler(event, context):
     """Extract the data from the event"""
-    data = jmespath.search("awslogs.data", event)
+    data = event['awslogs']['data']
     """Decompress the logs"""
     cwLogs = decompress_json_data(data)
     """Construct the payload"""
@@ -107,8 +150,7 @@ def prepare_payload(cwLogs):
     for logEvent in logEvents:
         request = {}
         request['id'] = logEvent['id']
-        dt = datetime.fromtimestamp(logEvent['timestamp'] / 1000) 
-        request['timestamp'] = dt.isoformat()
+        request['timestamp'] = format_timestamp(logEvent['timestamp'])
         request['message'] = logEvent['message'];
         request['owner'] = cwLogs['owner'];
         request['log_group'] = cwLogs['logGroup'];
@@ -116,11 +158,72 @@ def prepare_payload(cwLogs):
         payload.append(request)
     return payload
 
+def get_session():
+    """
+    Return the shared requests.Session, with keep-alive connections and
+    retries with exponential backoff on throttling and server errors
+    (honouring Retry-After).
+    """
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,   # retry POST too
+            raise_on_status=False,
+        )
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(max_retries=retry))
+        session.mount('http://', HTTPAdapter(max_retries=retry))
+        session.headers.update({'Content-Type': 'application/json', 'Accept': 'application/json'})
+        if SIGN_REQUESTS:
+            # imported here: the signer imports boto3, when installed, to
+            # find credentials, which unsigned (local) runs do not need
+            from requests_auth_aws_sigv4 import AWSSigV4
+            session.auth = AWSSigV4('osis')
+        _session = session
+    return _session
+
+def ingestion_url():
+    if '://' in INGESTION_ENDPOINT:
+        return INGESTION_ENDPOINT.rstrip('/') + INGESTION_PATH
+    return 'https://' + INGESTION_ENDPOINT + INGESTION_PATH
+
+def chunk_payload(payload, max_bytes=MAX_REQUEST_BYTES):
+    """
+    Yield JSON array request bodies (bytes) of the events in payload, each
+    at most max_bytes long.  An event too large by itself is sent alone.
+    """
+    chunk = []
+    size = 2
+    for event in payload:
+        item = json.dumps(event).encode('utf-8')
+        if chunk and size + len(item) + 1 > max_bytes:
+            yield b'[' + b','.join(chunk) + b']'
+            chunk = []
+            size = 2
+        chunk.append(item)
+        size += len(item) + 1
+    if chunk:
+        yield b'[' + b','.join(chunk) + b']'
+
 def ingestData(payload):
-    ingestionEndpoint = '{OpenSearch Pipeline Endpoint}'
-    endpoint = 'https://' + ingestionEndpoint
-    headers = {'Content-Type': 'application/json', 'Accept':'application/json'}
-    r = requests.request('POST', f'{endpoint}/logs/ingest', json=payload, auth=AWSSigV4('osis'), headers=headers)
-    LOGGER.info('Response received: ' + r.text)
-    return r
+    """
+    POST the events in payload to the ingestion pipeline, in as many
+    requests as MAX_REQUEST_BYTES requires.  Raise requests.HTTPError if
+    a request still fails after retries.
+    """
+    session = get_session()
+    url = ingestion_url()
+    headers = {'Content-Encoding': 'gzip'} if GZIP_REQUESTS else {}
+    responses = []
+    for body in chunk_payload(payload):
+        data = gzip.compress(body) if GZIP_REQUESTS else body
+        r = session.post(url, data=data, headers=headers, timeout=REQUEST_TIMEOUT)
+        LOGGER.info('Response received: %s %s (%d bytes sent, %d uncompressed)',
+                    r.status_code, r.text, len(data), len(body))
+        r.raise_for_status()
+        responses.append(r)
+    return responses
 
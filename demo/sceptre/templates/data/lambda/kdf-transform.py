@@ -39,8 +39,10 @@ The code below will:
 2) Decode & Unzip the message payload
 3) Look for JSON payloads and load objects if found. 
 4) Package each log event message as a separate record, adding metadata and converting timestamp to utc date/time value
-5) combine all log event records into JSON array 
-6) Build KDF JSON response object with log events base64 encoded (NOTE: code will not GZIP output)
+5) combine the log event records of each Firehose record into a JSON array (or NDJSON, see KDF_OUTPUT_FORMAT)
+6) Build KDF JSON response object with one entry per Firehose record, log events base64 encoded
+   (NOTE: output is only GZIPped with KDF_OUTPUT_GZIP=true)
+   Records that would push the response past Firehose's 6 MB limit are returned as ProcessingFailed.
 
 The output to S3 file will:
 
@@ -64,26 +66,107 @@ Example output file:
 
 Note: modify transformLogEvent() to change this output format to your desired output.
 
+Logging is set with the KDF_LOG_MODE environment variable: "off", "summary"
+(one line per invocation, the default) or "sampled" (also logs a
+KDF_LOG_SAMPLE_RATE fraction of log events before and after transformation).
+
+Noisy log events can be dropped before they are sent on with filter rules in
+KDF_FILTERS or KDF_FILTERS_FILE, matching the log group, the message or a
+JSON message field.  See the comment at _FILTERS_CONFIG.
+
 """
-import boto3
 import base64
+import collections
 import json
 import gzip
-from datetime import datetime
+from datetime import datetime, timezone
 import time
-import uuid
 import os
+import re
+import random
 import logging
 
 
+# optional faster JSON decoder, e.g. orjson from a Lambda layer.  Set
+# KDF_JSON_CODEC=json to always use the standard library.
+if os.environ.get('KDF_JSON_CODEC', 'orjson') == 'orjson':
+    try:
+        import orjson
+        _json_loads = orjson.loads
+    except ImportError:
+        _json_loads = json.loads
+else:
+    _json_loads = json.loads
+_JSON_WHITESPACE = ' \t\n\r'
+_LONG_DIGITS = re.compile(r'\d{19}')
+
+
+# KDF_LOG_MODE controls how much is logged; errors are always logged.
+#   off      - nothing else
+#   summary  - one line per invocation with record and event counts, bytes
+#              and latency (default)
+#   sampled  - the summary, plus the input and output of a random
+#              KDF_LOG_SAMPLE_RATE fraction of log events (default 0.01)
+_LOG_MODES = ('off', 'summary', 'sampled')
+_LOG_MODE = os.environ.get('KDF_LOG_MODE', 'summary').lower()
+_LOG_SAMPLE_RATE = float(os.environ.get('KDF_LOG_SAMPLE_RATE', '0.01'))
+
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+if _LOG_MODE not in _LOG_MODES:
+    logger.warning("[KDFXFORM] unknown KDF_LOG_MODE %r, using 'summary'", _LOG_MODE)
+    _LOG_MODE = 'summary'
+logger.setLevel(logging.WARNING if _LOG_MODE == 'off' else logging.INFO)
+
+# KDF_DECODE_WORKERS > 1 (or "auto" for one per CPU) base64 decodes and
+# gunzips the records of a batch on a thread pool, a few records ahead of
+# the one being transformed.
+# Both release the GIL on large buffers, so this helps with more memory
+# (and so more vCPUs) configured.  Default: decode serially.
+_DECODE_WORKERS = os.environ.get('KDF_DECODE_WORKERS', '1')
+_DECODE_WORKERS = (os.cpu_count() or 1) if _DECODE_WORKERS == 'auto' else int(_DECODE_WORKERS)
+_decodePool = None
+# records per decode worker decoded ahead of the one being transformed
+DECODE_AHEAD = 2
+
+# KDF_OUTPUT_FORMAT is "json-array" (default) for one JSON array of log events
+# per Firehose record, or "ndjson" for one log event per line.  With
+# KDF_OUTPUT_GZIP=true each record's output is also gzip compressed (at
+# KDF_OUTPUT_GZIP_LEVEL, default 6); the Firehose delivery stream must then
+# not compress it again, and S3 objects need a .gz suffix to be recognised.
+_OUTPUT_FORMATS = ('json-array', 'ndjson')
+_OUTPUT_FORMAT = os.environ.get('KDF_OUTPUT_FORMAT', 'json-array').lower()
+if _OUTPUT_FORMAT not in _OUTPUT_FORMATS:
+    raise ValueError("KDF_OUTPUT_FORMAT must be one of {}".format(_OUTPUT_FORMATS))
+_OUTPUT_GZIP = os.environ.get('KDF_OUTPUT_GZIP', 'false').lower() == 'true'
+_OUTPUT_GZIP_LEVEL = int(os.environ.get('KDF_OUTPUT_GZIP_LEVEL', '6'))
+
+# Log events to drop before they reach Firehose's destination, as a JSON
+# list of rules in KDF_FILTERS, or in a JSON file named by KDF_FILTERS_FILE.
+# A rule drops an event when all of its conditions match:
+#   logGroup  - regular expression searched in the log group name
+#   message   - regular expression searched in the raw message
+#   field     - top level key (or dotted path) of a JSON message, whose
+#               value must be one of "values"
+# and may have a "name" used in the dropped event counts.  A rule needs at
+# least one condition.  For example:
+#   [{"name": "health", "message": "GET /health"},
+#    {"name": "debug", "field": "level", "values": ["DEBUG", "debug"]},
+#    {"logGroup": "^/aws/lambda/noisy-"}]
+_FILTERS_CONFIG = os.environ.get('KDF_FILTERS', '')
+_FILTERS_FILE = os.environ.get('KDF_FILTERS_FILE', '')
+
 _LIST_KEY_NAME_ = "multivalue"
 _logGroup = ""
 _logStream = ""
 _owner = ""
 _cloudwatch_metadata = {}
 
+# Firehose fails the whole invocation when the Lambda response is larger
+# than 6 MB, so keep a margin below it
+MAX_RESPONSE_BYTES = 6000000
+# JSON framing of one response entry besides its recordId and data
+RECORD_OVERHEAD_BYTES = 64
+
 
 def has_key(thedict, keyvalue):
     if thedict.get(keyvalue) == None:
@@ -92,6 +175,62 @@ def has_key(thedict, keyvalue):
       return True
 
 
+class UtcTimestampFormatter:
+    """Format CloudWatch epoch millisecond timestamps as UTC ISO 8601.
+
+    The log events of a batch are mostly within a few seconds of each
+    other, so the date and time up to the second is kept from the previous
+    call and only the milliseconds are formatted per event.  Output matches
+    datetime.isoformat() plus 'Z', e.g. "2023-09-14T14:59:36.842000Z", and
+    "2023-09-14T14:59:36Z" on a whole second.
+    """
+
+    def __init__(self):
+        self._cached = (None, None)
+
+    def __call__(self, epoch_ms):
+        if type(epoch_ms) is not int:
+            dt = datetime.fromtimestamp(epoch_ms / 1000, timezone.utc)
+            return dt.replace(tzinfo=None).isoformat() + 'Z'
+        seconds, ms = divmod(epoch_ms, 1000)
+        cachedSeconds, prefix = self._cached
+        if seconds != cachedSeconds:
+            prefix = datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+            self._cached = (seconds, prefix)
+        if ms:
+            return '%s.%03d000Z' % (prefix, ms)
+        return prefix + 'Z'
+
+
+formatTimestamp = UtcTimestampFormatter()
+
+
+def looksLikeJson(message):
+    """Cheap check for messages worth handing to the JSON decoder.
+
+    Only JSON objects and arrays change the transformed event, so a message
+    must start (after JSON whitespace) with '{' or '['.  Plain text log
+    lines are rejected without raising and catching a decode error.
+    """
+    first = message[:1]
+    if first in _JSON_WHITESPACE:
+        first = message.lstrip(_JSON_WHITESPACE)[:1]
+    return first == '{' or first == '['
+
+
+def loadJson(message):
+    """Decode a JSON message with the configured codec."""
+    # orjson turns integers wider than 64 bits into floats, so leave
+    # messages with long digit runs to json
+    if _json_loads is json.loads or _LONG_DIGITS.search(message):
+        return json.loads(message)
+    try:
+        return _json_loads(message)
+    except ValueError:
+        # orjson rejects some input json accepts, e.g. NaN
+        return json.loads(message)
+
+
 def transformLogEvent(log_event):
     """Transform each log event.
 
@@ -103,60 +242,66 @@ def transformLogEvent(log_event):
     Returns:
     str: The transformed log event.
     """
-    processed_log_event = {
-        "message": "",
-        "timestamp": "",
-        "id": ""
-    }
-            
     # reformat timestamp
-    epoch_time_datetime = datetime.fromtimestamp(log_event['timestamp']/1000).isoformat()+'Z'
-    
-    logger.info("[KDFXFORM] processing record: "+str(log_event))
+    epoch_time_datetime = formatTimestamp(log_event['timestamp'])
     
-    try:
-        
-        # try to parse message for json 
-        json_message = json.loads(log_event["message"])
-        logger.info("[KDFXFORM] JSON Object Found! Using JSON object as log event. message set to JSON string value.")
+    # try to parse message for json 
+    json_message = None
+    message = log_event.get("message") if type(log_event) is dict else None
+    if isinstance(message, str) and looksLikeJson(message):
+        try:
+            json_message = loadJson(message)
+        except ValueError:
+            json_message = None
+
+    if isinstance(json_message, (dict, list)):
+        logger.debug("[KDFXFORM] JSON Object Found! Using JSON object as log event. message set to JSON string value.")
         
-        # if no exception thrown, message is json.  use dict object a log event message.
+        # message is json.  use dict object a log event message.
         # if object is an array then it must be enclosed in a JSON dict object
+        # the decoded object is not shared, so it is used without copying
         if isinstance(json_message, list):
-            logger.info("[KDFXFORM] JSON object type is <list>.  Assigning to global key name <{}>".format(_LIST_KEY_NAME_))
-            processed_log_event[_LIST_KEY_NAME_] = json_message.copy()
+            logger.debug("[KDFXFORM] JSON object type is <list>.  Assigning to global key name <%s>", _LIST_KEY_NAME_)
+            processed_log_event = {
+                "message": "",
+                "timestamp": "",
+                "id": "",
+                _LIST_KEY_NAME_: json_message
+            }
         else:
-            logger.info("[KDFXFORM] JSON object type is {}. Using json object direct copy".format(str(type(json_message))))
-            processed_log_event = json_message.copy()
+            logger.debug("[KDFXFORM] JSON object type is %s. Using json object direct copy", type(json_message))
+            processed_log_event = json_message
 
         processed_log_event['json_object'] = str(type(json_message))
-        processed_log_event['message'] = log_event["message"]
+        processed_log_event['message'] = message
         processed_log_event['timestamp'] = epoch_time_datetime
-        processed_log_event['id'] = log_event['id']   # uncomment if you want to keep the original id
-
-       
-        
-    except:
-        if type(log_event) is dict: 
+        if "id" in log_event:
+            processed_log_event['id'] = log_event['id']   # uncomment if you want to keep the original id
+        else:
+            logger.error("[KDFXFORM] \"id\" key not found in log event!  setting to null.")
+            processed_log_event['id'] = ""
 
-            if has_key(log_event,"message"): 
-                processed_log_event['message'] = log_event["message"]
-            else:
-                logger.error("[KDFXFORM] \"message\" key not found in log event!  setting to null.")
-                processed_log_event['message'] = ""
-                
+    elif type(log_event) is dict: 
+        processed_log_event = {}
 
-            processed_log_event['timestamp'] = epoch_time_datetime
+        if has_key(log_event,"message"): 
+            processed_log_event['message'] = log_event["message"]
+        else:
+            logger.error("[KDFXFORM] \"message\" key not found in log event!  setting to null.")
+            processed_log_event['message'] = ""
             
-            if has_key(log_event,"id"): 
-                processed_log_event['id'] = log_event["id"]   # uncomment if you want to keep the original id
-            else:
-                logger.error("[KDFXFORM] \"id\" key not found in log event!  setting to null.")
-                processed_log_event['id'] = ""               
+
+        processed_log_event['timestamp'] = epoch_time_datetime
+        
+        if has_key(log_event,"id"): 
+            processed_log_event['id'] = log_event["id"]   # uncomment if you want to keep the original id
         else:
-            # json parsing failure means message is string.  use original string as log event message.
-            logger.error("[KDFXFORM] log event is not a dict! Skipped Processing.")
-            processed_log_event = log_event
+            logger.error("[KDFXFORM] \"id\" key not found in log event!  setting to null.")
+            processed_log_event['id'] = ""               
+    else:
+        # json parsing failure means message is string.  use original string as log event message.
+        logger.error("[KDFXFORM] log event is not a dict! Skipped Processing.")
+        processed_log_event = log_event
     
     
     return processed_log_event
@@ -165,13 +310,246 @@ def transformLogEvent(log_event):
 
 
 
-def processRecords(records):
+class EventWriter:
+    """Incremental JSON output of one record's transformed log events.
+
+    Events are serialized one at a time into a single bytearray, so the
+    output exists once, as bytes, until it is (compressed and) base64
+    encoded.  The default framing writes exactly what json.dumps() of the
+    list of events would; with ndjson=True each event is written on its
+    own line instead.  With compresslevel set the output is gzipped.
+    """
+
+    def __init__(self, ndjson=False, compresslevel=None):
+        self.buffer = bytearray()
+        self.count = 0
+        self.compresslevel = compresslevel
+        if ndjson:
+            self._open, self._separator, self._close = b'', b'\n', b'\n'
+        else:
+            self._open, self._separator, self._close = b'[', b', ', b']'
+
+    def write(self, event):
+        self.buffer += self._separator if self.count else self._open
+        self.buffer += json.dumps(event).encode("utf-8")
+        self.count += 1
+
+    def base64(self):
+        """Close the output and return it base64 encoded, as a str."""
+        if self.count:
+            self.buffer += self._close
+        if self.compresslevel is not None:
+            # mtime=0 so the same events always give the same output
+            self.buffer = gzip.compress(self.buffer, self.compresslevel, mtime=0)
+        data = base64.b64encode(self.buffer)
+        self.buffer = None
+        return data.decode("ascii")
+
+
+
+def compileFilters(rules):
+    """Compile filter rules (see KDF_FILTERS) once per container.
+
+    Raises ValueError on an unknown key, a rule without any of logGroup,
+    message and field, or field without values (or values without field),
+    so a typo fails the deployment's first invocation instead of silently
+    letting everything through or dropping everything.
+    """
+    compiled = []
+    for i, rule in enumerate(rules):
+        unknown = set(rule) - {'name', 'logGroup', 'message', 'field', 'values'}
+        if unknown:
+            raise ValueError("filter rule {}: unknown keys {}".format(i, sorted(unknown)))
+        if not set(rule) & {'logGroup', 'message', 'field'}:
+            raise ValueError("filter rule {}: needs 'logGroup', 'message' or 'field'".format(i))
+        if 'field' in rule and not rule.get('values'):
+            raise ValueError("filter rule {}: 'field' requires 'values'".format(i))
+        if 'values' in rule and 'field' not in rule:
+            raise ValueError("filter rule {}: 'values' requires 'field'".format(i))
+        compiled.append({
+            'name': rule.get('name', 'rule' + str(i)),
+            'logGroup': re.compile(rule['logGroup']) if 'logGroup' in rule else None,
+            'message': re.compile(rule['message']) if 'message' in rule else None,
+            'field': rule['field'].split('.') if 'field' in rule else None,
+            'values': rule.get('values', []),
+        })
+    return compiled
+
+
+def loadFilters():
+    if _FILTERS_FILE:
+        with open(_FILTERS_FILE) as f:
+            return compileFilters(json.load(f))
+    if _FILTERS_CONFIG:
+        return compileFilters(json.loads(_FILTERS_CONFIG))
+    return []
+
+
+_FILTERS = loadFilters()
+
+
+def recordFilters(logGroup):
+    """Return (record rule, message rules, field rules) for a log group.
+
+    A record rule, if any, is a rule with only a matching logGroup: it
+    drops every event of the record.
+    """
+    messageRules = []
+    fieldRules = []
+    for rule in _FILTERS:
+        if rule['logGroup'] is not None and not rule['logGroup'].search(logGroup or ''):
+            continue
+        if rule['field'] is not None:
+            fieldRules.append(rule)
+        elif rule['message'] is not None:
+            messageRules.append(rule)
+        else:
+            return rule, [], []
+    return None, messageRules, fieldRules
+
+
+def matchesMessage(rule, log_event):
+    message = log_event.get('message') if type(log_event) is dict else None
+    return isinstance(message, str) and rule['message'].search(message) is not None
+
+
+def matchesField(rule, log_event, xform_event):
+    value = xform_event
+    for key in rule['field']:
+        if type(value) is not dict or key not in value:
+            return False
+        value = value[key]
+    return value in rule['values'] and (rule['message'] is None or matchesMessage(rule, log_event))
+
+
+def countDropped(stats, rule, count=1):
+    if stats is not None:
+        stats['dropped'] += count
+        stats['dropped:' + rule['name']] += count
+
+
+def sampleLogEvent():
+    """Return True if this log event should be logged in 'sampled' mode."""
+    return _LOG_MODE == 'sampled' and random.random() < _LOG_SAMPLE_RATE
+
+
+def transformRecord(record, stats=None, decoded=None):
+    """Transform one Firehose record.
+
+    Args:
+        record (dict): A Firehose record. Structure is {"recordId": str, "data": str}
+        stats (Counter): Optional counter of log events, see lambda_handler().
+        decoded (bytes): The record data already decoded by decodeRecords(),
+            or the exception decoding it raised.
+
+    Returns:
+        tuple: (result, data) where result is 'Ok' or 'Dropped' and data is the
+        base64 encoded JSON array (or NDJSON, optionally gzipped) of the
+        record's transformed log events, or '' for a dropped record.
+    """
+
+    # Kinesis data streams are base64 encoded so decode here
+    if decoded is None:
+        decoded = decodeGzipBase64(record['data'])
+    elif isinstance(decoded, Exception):
+        raise decoded
+    payload = json.loads(decoded)
+    # only the parsed payload is needed from here on
+    del decoded
+
+    # set cloudwatch met values
+    try:
+        _logGroup = payload['logGroup']
+        _logStream = payload['logStream']
+        _owner = payload['owner']
+        _cloudwatch_metadata = {
+            "logGroup": _logGroup,
+            "logStream": _logStream,
+            "owner": _owner
+        }
+        
+        logger.debug("[KDFXFORM] processing next record with cloudwatch metadata: %s", _cloudwatch_metadata)
+
+        
+    except Exception as ex:
+        # log error message
+        logger.error("[KDFXFORM] ERROR trying to access logevent metadata values: %s", ex)
+        
+    # process the record, writing each transformed event to the output
+    # buffer as soon as it is made rather than collecting them in a list
+    output = EventWriter(
+        ndjson=_OUTPUT_FORMAT == 'ndjson',
+        compresslevel=_OUTPUT_GZIP_LEVEL if _OUTPUT_GZIP else None,
+    )
+
+    if(payload['messageType'] == 'DATA_MESSAGE'):
+
+        # pop the events off the payload so each is freed once written
+        logEvents = payload['logEvents']
+        recordRule, messageRules, fieldRules = recordFilters(payload.get('logGroup'))
+        if recordRule is not None:
+            countDropped(stats, recordRule, len(logEvents))
+            del logEvents[:]
+        logEvents.reverse()
+        while logEvents:
+            log_event = logEvents.pop()
+
+            # drop filtered events, by raw message before transforming
+            # them and by JSON field value after
+            droppedBy = next((rule for rule in messageRules if matchesMessage(rule, log_event)), None)
+            if droppedBy is not None:
+                countDropped(stats, droppedBy)
+                continue
+
+            sampled = sampleLogEvent()
+            if sampled:
+                logger.info("[KDFXFORM] processing log event: %s", log_event)
+
+            # append to list of processed records
+            xform_event = transformLogEvent(log_event)
+
+            droppedBy = next((rule for rule in fieldRules if matchesField(rule, log_event, xform_event)), None)
+            if droppedBy is not None:
+                countDropped(stats, droppedBy)
+                continue
+            
+            xform_event["cloudwatch"] = {
+                "logGroup": _logGroup,
+                "logStream": _logStream,
+                "owner": _owner
+            }
+
+            # log transformed event 
+            if sampled:
+                logger.info("[KDFXFORM] transformed event: %s", xform_event)
+            
+            output.write(xform_event)
+
+    if stats is not None:
+        stats['events'] += output.count
+
+    # CONTROL_MESSAGE records and records without (unfiltered) log events
+    # are dropped.  Firehose ignores their data, so none is sent back to
+    # take up the response size limit.
+    if(output.count>0):
+        return 'Ok', output.base64()
+    return 'Dropped', ''
+
+
+
+def processRecords(records, stats=None):
     """Process the records.
     
     This function processes the records and returns the processed records.
+    Every input record gets exactly one response, with its own recordId.
+    A record that fails to transform, or whose output would push the
+    response past MAX_RESPONSE_BYTES, is returned as ProcessingFailed so
+    Firehose sends it to the error output instead of retrying the batch.
     
     Args:
         records (list): The list of records to process.
+        stats (Counter): Optional counter of records, results, events and
+            bytes, see lambda_handler().
     
     Returns:
         list: A list of processed records.
@@ -179,68 +557,37 @@ def processRecords(records):
     """
 
     processedRecords=[]
-    result = []
+    responseBytes = 0
+    decodedRecords = decodeRecords(records)
     
     for record in records:
-        # Kinesis data streams are base64 encoded so decode here
-        payload = loadJsonGzipBase64(record['data'])
-
-        # set cloudwatch met values
         try:
-            _logGroup = payload['logGroup']
-            _logStream = payload['logStream']
-            _owner = payload['owner']
-            _cloudwatch_metadata = {
-                "logGroup": _logGroup,
-                "logStream": _logStream,
-                "owner": _owner
-            }
-            
-            logger.info("[KDFXFORM] processing next record with cloudwatch metadata:" + str(_cloudwatch_metadata))
-
-            
+            # passed on without keeping a reference, so transformRecord
+            # can free the decoded data as soon as it is parsed
+            result, data = transformRecord(record, stats, next(decodedRecords))
         except Exception as ex:
-            # log error message
-            logger.error("[KDFXFORM] ERROR trying to access logevent metadata values: "+str(ex))
-            
-        # process the record
-
-        if(payload['messageType'] == 'DATA_MESSAGE'):
-
-            for log_event in payload['logEvents']:
-                # append to list of processed records
-                xform_event = transformLogEvent(log_event)
-                
-                xform_event["cloudwatch"] = {
-                    "logGroup": _logGroup,
-                    "logStream": _logStream,
-                    "owner": _owner
-                }
-    
-                # log transformed event 
-                logger.info("[KDFXFORM] transformed event: "+str(xform_event))
-                
-                result.append(xform_event)
-        
-
-    if(len(result)>0):
-            b64result = base64.b64encode(json.dumps(result).encode("utf-8"))
-            processedRecords.append(
-                    {
-                        'recordId': record['recordId'],
-                        'result': 'Ok',
-                        'data': b64result
-                    }
-            )
-                
-    else:
-            processedRecords.append(
-                    {
-                        'recordId': record['recordId'],
-                        'result': 'Dropped',
-                        'data': record['data']
-                    }
-            )
+            logger.error("[KDFXFORM] ERROR processing record %s: %s", record['recordId'], ex)
+            result, data = 'ProcessingFailed', None
+
+        processedRecord = {
+            'recordId': record['recordId'],
+            'result': result
+        }
+        recordBytes = len(record['recordId']) + RECORD_OVERHEAD_BYTES
+        if data is not None and responseBytes + recordBytes + len(data) <= MAX_RESPONSE_BYTES:
+            processedRecord['data'] = data
+            recordBytes += len(data)
+        elif result == 'Ok':
+            logger.error("[KDFXFORM] response size limit reached, record %s returned as ProcessingFailed", record['recordId'])
+            processedRecord['result'] = 'ProcessingFailed'
+
+        responseBytes += recordBytes
+        processedRecords.append(processedRecord)
+        if stats is not None:
+            stats['records'] += 1
+            stats[processedRecord['result']] += 1
+            stats['bytesIn'] += len(record['data'])
+            stats['bytesOut'] += len(processedRecord.get('data', ''))
 
 
     # return list of processed records
@@ -248,8 +595,64 @@ def processRecords(records):
 
 
 
+def decodeGzipBase64(base64Data):
+    return gzip.decompress(base64.b64decode(base64Data))
+
+
+
 def loadJsonGzipBase64(base64Data):
-    return json.loads(gzip.decompress(base64.b64decode(base64Data)))
+    return json.loads(decodeGzipBase64(base64Data))
+
+
+
+def decodeRecordData(record):
+    try:
+        return decodeGzipBase64(record['data'])
+    except Exception as ex:
+        return ex
+
+
+
+def decodeRecords(records):
+    """Yield the decoded data of each record, in order, or the exception
+    decoding it raised.
+
+    With a decode pool (see KDF_DECODE_WORKERS) at most DECODE_AHEAD
+    records per worker are decoded ahead of the caller, so only those are
+    held in memory besides the record being transformed.  Without a pool
+    None is yielded and records are decoded as they are transformed.
+    """
+    global _decodePool
+    if _DECODE_WORKERS < 2 or len(records) < 2:
+        for record in records:
+            yield None
+        return
+    if _decodePool is None:
+        # only imported when a pool is configured, to keep cold starts short
+        import concurrent.futures
+        # kept for the life of the container, across invocations
+        _decodePool = concurrent.futures.ThreadPoolExecutor(max_workers=_DECODE_WORKERS)
+    pending = collections.deque()
+    for record in records:
+        pending.append(_decodePool.submit(decodeRecordData, record))
+        if len(pending) > _DECODE_WORKERS * DECODE_AHEAD:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+
+class FilterCounts:
+    """Lazily formatted dropped event counts per filter rule."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __str__(self):
+        counts = ["{} {}".format(key[len('dropped:'):], count)
+                  for key, count in sorted(self.stats.items())
+                  if key.startswith('dropped:') and count]
+        return ": " + ", ".join(counts) if counts else ""
 
 
 
@@ -259,11 +662,20 @@ def lambda_handler(event, context):
     """
     This function receives the event from Kinesis Firehose and processes the records.
     """
+    if _LOG_MODE == 'off':
+        return {'records': processRecords(event['records'])}
+
     # process the records
-    records = processRecords(event['records'])
-    # print the records
-    x = { "records": records }
-    logger.info("FINAL VALUE: "+str(x))
+    start = time.perf_counter()
+    stats = collections.Counter()
+    records = processRecords(event['records'], stats)
+    logger.info(
+        "[KDFXFORM] batch summary: %d records (%d Ok, %d Dropped, %d ProcessingFailed), "
+        "%d log events (%d filtered out%s), %d bytes in, %d bytes out, %.1f ms",
+        stats['records'], stats['Ok'], stats['Dropped'], stats['ProcessingFailed'],
+        stats['events'], stats['dropped'], FilterCounts(stats),
+        stats['bytesIn'], stats['bytesOut'],
+        (time.perf_counter() - start) * 1000)
 
     # return the processed records
     return {'records': records}
@@ -0,0 +1,133 @@
+"""
+function.py against a local stand-in for the OpenSearch Ingestion
+endpoint: requests are split below OSIS_MAX_REQUEST_BYTES, gzipped, and
+retried after a 429.
+
+    python -m pytest test/test_function_ingest.py
+"""
+import base64
+import gzip
+import http.server
+import importlib.util
+import json
+import os
+import threading
+
+import pytest
+
+FUNCTION = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', 'demo', 'sceptre', 'templates', 'data', 'lambda', 'function.py')
+
+MAX_REQUEST_BYTES = 1000
+
+
+class IngestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Records every request, and answers with the next of the server's
+    'statuses' (200 once they run out).
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, dict(self.headers), body))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), IngestHandler)
+    server.requests = []
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def load_function(monkeypatch, server, gzip_requests='true'):
+    """
+    Import a fresh copy of function.py, which reads its settings at import
+    time, pointed at 'server'.
+    """
+    monkeypatch.setenv('OSIS_ENDPOINT', 'http://127.0.0.1:{}'.format(server.server_address[1]))
+    monkeypatch.setenv('OSIS_SIGV4', 'false')
+    monkeypatch.setenv('OSIS_GZIP', gzip_requests)
+    monkeypatch.setenv('OSIS_MAX_REQUEST_BYTES', str(MAX_REQUEST_BYTES))
+    monkeypatch.setenv('OSIS_RETRY_BACKOFF', '0')
+    spec = importlib.util.spec_from_file_location('function', FUNCTION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cloudwatch_event(count):
+    logs = dict(
+        messageType='DATA_MESSAGE',
+        owner='123456789012',
+        logGroup='/aws/lambda/app',
+        logStream='2023/09/14/[$LATEST]9ae39e4917c04e7486a6cb81f892f33b',
+        subscriptionFilters=['filter'],
+        logEvents=[dict(id=str(i), timestamp=1694703576842 + i,
+                        message='log message {} {}'.format(i, 'x' * 100))
+                   for i in range(count)],
+    )
+    data = base64.b64encode(gzip.compress(json.dumps(logs).encode('utf-8'))).decode('ascii')
+    return dict(awslogs=dict(data=data))
+
+
+def request_events(request, gzipped=True):
+    path, headers, body = request
+    assert path == '/logs/ingest'
+    if gzipped:
+        assert headers['Content-Encoding'] == 'gzip'
+        body = gzip.decompress(body)
+    else:
+        assert 'Content-Encoding' not in headers
+    assert len(body) <= MAX_REQUEST_BYTES
+    return json.loads(body)
+
+
+@pytest.mark.parametrize('gzip_requests', ['true', 'false'])
+def test_events_are_chunked_below_max_request_bytes(monkeypatch, server, gzip_requests):
+    function = load_function(monkeypatch, server, gzip_requests)
+    assert function.lambda_handler(cloudwatch_event(50), None) == dict(statusCode=200)
+    assert len(server.requests) > 1
+    events = [event for request in server.requests
+              for event in request_events(request, gzip_requests == 'true')]
+    assert [event['id'] for event in events] == [str(i) for i in range(50)]
+    assert events[1]['timestamp'] == '2023-09-14T14:59:36.843000Z'
+    assert events[1]['log_group'] == '/aws/lambda/app'
+
+
+def test_oversized_event_is_sent_alone(monkeypatch, server):
+    function = load_function(monkeypatch, server)
+    payload = [dict(id='1', message='x' * 2 * MAX_REQUEST_BYTES), dict(id='2', message='y')]
+    assert [len(json.loads(body)) for body in function.chunk_payload(payload)] == [1, 1]
+
+
+def test_throttled_request_is_retried(monkeypatch, server):
+    server.statuses = [429]
+    function = load_function(monkeypatch, server)
+    function.lambda_handler(cloudwatch_event(3), None)
+    assert len(server.requests) == 2
+    assert request_events(server.requests[0]) == request_events(server.requests[1])
+
+
+def test_request_failing_after_retries_raises(monkeypatch, server):
+    server.statuses = [500] * 10
+    monkeypatch.setenv('OSIS_MAX_RETRIES', '2')
+    function = load_function(monkeypatch, server)
+    with pytest.raises(function.requests.HTTPError):
+        function.lambda_handler(cloudwatch_event(3), None)
+    assert len(server.requests) == 3
@@ -0,0 +1,164 @@
+"""
+kdf-transform.py output formats: json-array and ndjson, with and without
+gzip, and decoding on the decode pool, must give the same log events and
+record results.
+
+    python -m pytest test/test_kdf_transform_output.py
+"""
+import base64
+import gzip
+import importlib.util
+import json
+import os
+
+import pytest
+
+KDF_TRANSFORM = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', 'demo', 'sceptre', 'templates', 'data', 'lambda', 'kdf-transform.py')
+
+MODES = [
+    ('json-array', 'false'),
+    ('json-array', 'true'),
+    ('ndjson', 'false'),
+    ('ndjson', 'true'),
+]
+
+
+def encode(payload):
+    return base64.b64encode(gzip.compress(json.dumps(payload).encode('utf-8'))).decode('ascii')
+
+
+def data_message(log_group, log_events):
+    return dict(
+        messageType='DATA_MESSAGE',
+        owner='123456789012',
+        logGroup=log_group,
+        logStream='2023/09/14/[$LATEST]9ae39e4917c04e7486a6cb81f892f33b',
+        subscriptionFilters=['filter'],
+        logEvents=log_events,
+    )
+
+
+RECORDS = [
+    dict(recordId='1', data=encode(data_message('/aws/lambda/app', [
+        dict(id='37793152654191904442680491486618333209652445892414210048',
+             timestamp=1694703576842, message='[INFO] plain text message'),
+        dict(id='37793152654191904442680491486618333209652445892414210049',
+             timestamp=1694703577000,
+             message='{"level": "INFO", "path": "/", "bytes": 1234, "nested": {"a": [1, 2.5, null]}}'),
+        dict(id='37793152654191904442680491486618333209652445892414210050',
+             timestamp=1694703577001, message='café ✓ "quoted"\nsecond line'),
+    ]))),
+    dict(recordId='2', data=encode(dict(
+        messageType='CONTROL_MESSAGE',
+        owner='CloudwatchLogs',
+        logGroup='',
+        logStream='',
+        subscriptionFilters=[],
+        logEvents=[dict(id='', timestamp=1694703576842,
+                        message='CWL CONTROL MESSAGE: Checking health of destination Firehose.')],
+    ))),
+    dict(recordId='3', data=encode(data_message('/aws/ecs/web', [
+        dict(id='37793152654191904442680491486618333209652445892414210051',
+             timestamp=1694703578123, message='{"level": "DEBUG", "request": 12345678901234567890}'),
+    ]))),
+]
+
+
+def load_kdf_transform(monkeypatch, output_format, output_gzip, decode_workers='1'):
+    """
+    Import a fresh copy of kdf-transform.py, which reads its settings at
+    import time.
+    """
+    monkeypatch.setenv('KDF_DECODE_WORKERS', decode_workers)
+    monkeypatch.setenv('KDF_OUTPUT_FORMAT', output_format)
+    monkeypatch.setenv('KDF_OUTPUT_GZIP', output_gzip)
+    monkeypatch.setenv('KDF_LOG_MODE', 'off')
+    for name in ('KDF_FILTERS', 'KDF_FILTERS_FILE'):
+        monkeypatch.delenv(name, raising=False)
+    spec = importlib.util.spec_from_file_location('kdf_transform', KDF_TRANSFORM)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def decode_events(data, output_format, output_gzip):
+    data = base64.b64decode(data)
+    if output_gzip == 'true':
+        data = gzip.decompress(data)
+    if output_format == 'ndjson':
+        return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+    return json.loads(data)
+
+
+def transform(monkeypatch, output_format, output_gzip):
+    """
+    Return [(recordId, result, events)] from lambda_handler over RECORDS.
+    """
+    kdf_transform = load_kdf_transform(monkeypatch, output_format, output_gzip)
+    response = kdf_transform.lambda_handler(dict(records=json.loads(json.dumps(RECORDS))), None)
+    results = []
+    for record in response['records']:
+        events = None
+        if record['result'] == 'Ok':
+            events = decode_events(record['data'], output_format, output_gzip)
+        results.append((record['recordId'], record['result'], events))
+    return results
+
+
+def test_json_array_output(monkeypatch):
+    results = transform(monkeypatch, 'json-array', 'false')
+    assert [r[:2] for r in results] == [('1', 'Ok'), ('2', 'Dropped'), ('3', 'Ok')]
+    assert [len(r[2]) for r in results if r[2] is not None] == [3, 1]
+    event = results[0][2][1]
+    assert event['nested'] == dict(a=[1, 2.5, None])
+    assert event['timestamp'] == '2023-09-14T14:59:37Z'
+    assert event['cloudwatch']['logGroup'] == '/aws/lambda/app'
+    assert results[0][2][2]['message'] == 'café ✓ "quoted"\nsecond line'
+    assert results[2][2][0]['request'] == 12345678901234567890
+
+
+@pytest.mark.parametrize('output_format,output_gzip', MODES[1:])
+def test_output_modes_decode_to_json_array_events(monkeypatch, output_format, output_gzip):
+    expected = transform(monkeypatch, 'json-array', 'false')
+    assert transform(monkeypatch, output_format, output_gzip) == expected
+
+
+def test_control_message_record_is_dropped_without_data(monkeypatch):
+    for output_format, output_gzip in MODES:
+        kdf_transform = load_kdf_transform(monkeypatch, output_format, output_gzip)
+        response = kdf_transform.lambda_handler(dict(records=[dict(RECORDS[1])]), None)
+        assert response['records'] == [dict(recordId='2', result='Dropped', data='')]
+
+
+def test_dropped_records_do_not_count_toward_response_size(monkeypatch):
+    kdf_transform = load_kdf_transform(monkeypatch, 'json-array', 'false')
+    monkeypatch.setattr(kdf_transform, 'MAX_RESPONSE_BYTES', 2000)
+    # each record alone is larger than the response limit
+    control = dict(RECORDS[1], data=encode(dict(
+        messageType='CONTROL_MESSAGE', owner='CloudwatchLogs', logGroup='', logStream='',
+        subscriptionFilters=[], logEvents=[dict(id='', timestamp=0, message=os.urandom(2000).hex())])))
+    assert len(control['data']) > 2000
+    records = [dict(control, recordId=str(i)) for i in range(10)] + [dict(RECORDS[2])]
+    response = kdf_transform.lambda_handler(dict(records=records), None)
+    assert [r['result'] for r in response['records']] == ['Dropped'] * 10 + ['Ok']
+
+
+def test_decode_pool_output_matches_serial_decoding(monkeypatch):
+    expected = transform(monkeypatch, 'json-array', 'false')
+    kdf_transform = load_kdf_transform(monkeypatch, 'json-array', 'false', decode_workers='2')
+    records = json.loads(json.dumps(RECORDS)) * 5
+    records.append(dict(recordId='bad', data='not base64 gzip'))
+    response = kdf_transform.lambda_handler(dict(records=records), None)
+    assert [r['result'] for r in response['records']] == [r[1] for r in expected] * 5 + ['ProcessingFailed']
+    assert [decode_events(r['data'], 'json-array', 'false') for r in response['records'][:3]
+            if r['result'] == 'Ok'] == [r[2] for r in expected if r[2] is not None]
+
+
+def test_decode_pool_decodes_a_bounded_window_ahead(monkeypatch):
+    kdf_transform = load_kdf_transform(monkeypatch, 'json-array', 'false', decode_workers='2')
+    decoded = kdf_transform.decodeRecords([dict(RECORDS[0])] * 20)
+    next(decoded)
+    pending = decoded.gi_frame.f_locals['pending']
+    assert len(pending) == 2 * kdf_transform.DECODE_AHEAD
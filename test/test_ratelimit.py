@@ -0,0 +1,55 @@
+"""
+util/ratelimit.py: a limited service never gets more requests per second
+than its limit, starting with the first second.
+
+    python -m pytest test/test_ratelimit.py
+"""
+import threading
+import time
+
+from uc3_sceptre_utils.util import ratelimit
+
+RATE = 5
+THREADS = 8
+# threads wake up a little late from their sleeps, so requests spaced
+# exactly 1 / RATE apart can be measured slightly closer together
+JITTER = 0.02
+
+
+def acquire_times(bucket, duration):
+    """
+    Return the sorted times at which THREADS threads, each taking tokens
+    in a loop for 'duration' seconds, were let through.
+    """
+    times = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        while True:
+            bucket.acquire()
+            now = time.monotonic()
+            if now > deadline:
+                return
+            with lock:
+                times.append(now)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(times)
+
+
+def test_first_second_is_within_rate():
+    start = time.monotonic()
+    times = acquire_times(ratelimit.TokenBucket(RATE), 1.5)
+    assert len([t for t in times if t < start + 1.0]) <= RATE
+
+
+def test_no_one_second_window_exceeds_rate():
+    times = acquire_times(ratelimit.TokenBucket(RATE), 2.5)
+    assert len(times) >= 2 * RATE
+    for i, t in enumerate(times):
+        assert len([u for u in times[i:] if u < t + 1.0 - JITTER]) <= RATE
@@ -4,6 +4,7 @@ import re
 from sceptre.hooks import Hook
 from sceptre.exceptions import SceptreException
 from sceptre.exceptions import InvalidHookArgumentSyntaxError
+from uc3_sceptre_utils.util import clients, ensure, metrics
 
 
 class AccountVerifier(Hook):
@@ -22,6 +23,7 @@ class AccountVerifier(Hook):
     def __init__(self, *args, **kwargs):
         super(AccountVerifier, self).__init__(*args, **kwargs)
 
+    @metrics.scoped
     def run(self):
         """
         Compare argument to AWS Account Id.
@@ -43,11 +45,13 @@ class AccountVerifier(Hook):
                 )
             )
 
-        response = self.stack.connection_manager.call(
-            service="sts",
-            command="get_caller_identity",
+        return ensure.ensure(__name__, configured_account_id, self.stack,
+                             lambda: self._verify(configured_account_id))
+
+    def _verify(self, configured_account_id):
+        actual_account_id = clients.get_account_id(
+            connection_manager=self.stack.connection_manager
         )
-        actual_account_id = response["Account"]
 
         if not actual_account_id == configured_account_id:
             raise SceptreException(
@@ -14,6 +14,17 @@ Optional Keyword arguments:
 
 :subalt_names:      Additional subject alternative names for the certificate.
                     This can be a comma separated list of domain names.
+:certificates:      A list of certificates to handle in one hook, in place of
+                    cert_fqdn and subalt_names.  Each item takes cert_fqdn and
+                    optionally subalt_names and validation_domain (which defaults
+                    to the top level validation_domain).  New certificates are
+                    requested concurrently, their validation records are created
+                    with one route53 change per validation domain, and they are
+                    waited for together.
+:timeout:           Seconds to wait for a requested certificate to be issued.
+                    Default: 300.
+:use_waiter:        Set to "true" to wait with botocore's certificate_validated
+                    waiter rather than polling with exponential backoff.
 
 Example sceptre config usage:
 
@@ -31,16 +42,25 @@ hooks:
         cert_fqdn: ashley-demo.example.com
         validation_domain: example.com
         region: us-east-1
+
+  before_update:
+    - !acm_certificate
+        action: request
+        validation_domain: example.com
+        region: us-east-1
+        certificates:
+          - cert_fqdn: api.example.com
+          - cert_fqdn: ui.example.com
+            subalt_names: www.ui.example.com
 """
 
 import sys
-import time
 import re
 
 from sceptre.cli.helpers import setup_logging
 from sceptre.hooks import Hook
 from sceptre.exceptions import InvalidHookArgumentSyntaxError
-from uc3_sceptre_utils.util import acm, route53
+from uc3_sceptre_utils.util import acm, clients, metrics, route53
 
 
 class AcmCertificate(Hook):
@@ -50,34 +70,150 @@ class AcmCertificate(Hook):
     def _usage(self):
         print(__doc__)
 
-    def _handle_cert_request(self, cert_fqdn, subalt_names, validation_domain, region):
+    def _parse_cert_specs(self):
         """
-        Handle certificate request process.  Allow time for cert to be
-        auto-signed.  Times out after 5 minutes.
+        Return a list of dicts with keys cert_fqdn, subalt_names and
+        validation_domain, from either the 'certificates' list or the top
+        level arguments.
         """
-        acm.request_cert(cert_fqdn, subalt_names, validation_domain, region)
-        tries = 0
-        max_tries = 30
-        interval = 10
-        while tries < max_tries:
-            time.sleep(interval)
-            cert = acm.get_cert_object(cert_fqdn, region)
-            if cert['Status'] != 'ISSUED':
-                tries += 1
-                self.logger.info('{} - Request status: {}'.format(
-                    __name__, cert['Status'])
-                )
-            else:
-                break
-        self.logger.info('{} - Cert: {} - Status: {}'.format(
-            __name__, cert_fqdn, cert['Status'])
+        if 'certificates' in self.argument:
+            cert_args = self.argument['certificates']
+        else:
+            cert_args = [self.argument]
+        cert_specs = []
+        for cert_arg in cert_args:
+            validation_domain = cert_arg.get(
+                'validation_domain', self.argument.get('validation_domain'))
+            missing = [arg for arg in ['cert_fqdn'] if arg not in cert_arg]
+            if not validation_domain:
+                missing.append('validation_domain')
+            if missing:
+                self._usage()
+                raise InvalidHookArgumentSyntaxError(
+                    '{}: some required keyword arguments are missing: {}'.format(__name__, missing))
+            subalt_names = cert_arg.get('subalt_names', [])
+            if isinstance(subalt_names, str):
+                subalt_names = subalt_names.split(',')
+            cert_specs.append(dict(
+                cert_fqdn=cert_arg['cert_fqdn'],
+                subalt_names=subalt_names,
+                validation_domain=validation_domain,
+            ))
+        return cert_specs
+
+    def _handle_cert_requests(self, cert_specs, region,
+                              timeout=acm.ISSUE_TIMEOUT, use_waiter=False):
+        """
+        Handle certificate request process.  Allow time for certs to be
+        auto-signed, checking right away and then backing off.  Times out
+        after 'timeout' seconds (5 minutes by default).
+        """
+        connection_manager = clients.stack_connection_manager(self.stack)
+        cert_arns = acm.request_certs(cert_specs, region, connection_manager)
+        results = acm.wait_for_certs_issued(
+            cert_arns, region, connection_manager,
+            timeout=timeout, use_waiter=use_waiter,
         )
+        for cert_spec, (cert, stats) in zip(cert_specs, results):
+            self.logger.info('{} - Cert: {} - Status: {} - waited {:.1f}s ({} checks)'.format(
+                __name__, cert_spec['cert_fqdn'], cert['Status'], stats.elapsed,
+                stats.attempts if stats.attempts is not None else 'waiter')
+            )
         return
 
+    def _check_cert(self, cert_spec, cert, region, connection_manager):
+        """
+        Handle the 'request' action for an existing certificate.  Return True
+        if the certificate needs to be (re-)requested.
+        """
+        cert_fqdn = cert_spec['cert_fqdn']
+        validation_domain = cert_spec['validation_domain']
+        if not cert:
+            self.logger.info('{} - Requesting certificate for {}'.format(
+                __name__, cert_fqdn)
+            )
+            return True
+
+        elif cert['Status'] == 'ISSUED':
+            self.logger.info('{} - Cert: {} - Status: {}'.format(
+                __name__, cert_fqdn, cert['Status'])
+            )
+
+        elif cert['Status'] == 'PENDING_VALIDATION':
+            self.logger.info('{} - Cert: {} - Status: {}'.format(
+                __name__, cert_fqdn, cert['Status'])
+            )
+            if any(option.get("ValidationMethod") == "DNS"
+                   for option in cert["DomainValidationOptions"]):
+                acm.request_validation(cert, validation_domain, region,
+                                       connection_manager=connection_manager)
+
+        elif cert['Status'] == 'VALIDATION_TIMED_OUT':
+            self.logger.info('{} - Cert: {} - Status: {}'.format(
+                __name__, cert_fqdn, cert['Status'])
+            )
+            self.logger.info('{} - Deleting certificate: {}'.format(
+                __name__, cert['CertificateArn'])
+            )
+            acm.delete_cert(cert['CertificateArn'], region=region,
+                            connection_manager=connection_manager)
+            self.logger.info('{} - Re-requesting certificate: {}'.format(
+                __name__, cert_fqdn)
+            )
+            return True
+
+        elif cert['Status'] == 'FAILED':
+            raise RuntimeError('ACM certificate request failed: {}'.format(
+                cert['FailureReason']))
+
+        elif cert['Status'] == 'REVOKED':
+            raise RuntimeError('ACM certificate is in revoked state: {}'.format(
+                cert['RevocationReason']))
+
+        else:
+            raise RuntimeError('ACM certificate status is {}'.format(cert['Status']))
+        return False
+
+    def _delete_cert(self, cert_spec, cert, region, connection_manager):
+        """
+        Handle the 'delete' action for one certificate.
+        """
+        cert_fqdn = cert_spec['cert_fqdn']
+        validation_domain = cert_spec['validation_domain']
+        if cert:
+            self.logger.info('{} - Deleting certificate: {}'.format(
+                __name__, cert['CertificateArn'])
+            )
+            acm.delete_cert(cert['CertificateArn'], region=region,
+                            connection_manager=connection_manager)
+
+        # clean up route53 certificate validation CNAME entry
+        if not cert_fqdn.endswith('.'):
+            cert_fqdn += '.'
+        validation_cname_pattern=re.compile(r'_\w{32}\.' + re.escape(cert_fqdn))
+        record_set = route53.get_resource_record_set(
+            hosted_zone=validation_domain,
+            record_type='CNAME',
+            pattern=validation_cname_pattern,
+            connection_manager=connection_manager,
+            under=cert_fqdn,
+        )
+        if isinstance(record_set, list):
+            raise RuntimeError('multiple certificate validation CNAME record sets '
+            'found matching "{}"'.format(cert_fqdn)
+        )
+        if record_set:
+            self.logger.info('{} - Deleting route53 certificate validation '
+                'CNAME: {}'.format(__name__, cert_fqdn)
+            )
+            route53.change_record_set(record_set, validation_domain, 'DELETE',
+                                      connection_manager=connection_manager)
+
+    @metrics.scoped
     def run(self):
         # parse self.argument string
         self.logger.info('{} - self.argument: {}'.format(__name__, self.argument))
-        required_args = ['action', 'cert_fqdn', 'validation_domain', 'region']
+        required_args = ['action', 'region']
         missing = []
         for arg in required_args:
             if arg not in self.argument:
@@ -86,95 +222,32 @@ class AcmCertificate(Hook):
             self._usage()
             raise InvalidHookArgumentSyntaxError(
                 '{}: some required keyword arguments are missing: {}'.format(__name__, missing))
-        if 'subalt_names' in self.argument:
-            subalt_names = self.argument['subalt_names'].split(',')
-        else:
-            subalt_names = []
         action = self.argument['action']
-        cert_fqdn = self.argument['cert_fqdn']
-        validation_domain = self.argument['validation_domain']
-        region = self.argument['region']
-        self.logger.info('{} -  parsed args:- action: {}, cert_fqdn: {}, subalt_names: {}, validation_domain: {}, region: {}'.format(__name__, action, cert_fqdn, subalt_names, validation_domain, region))
-
-        # determine certificate status and handle accordingly
-        cert = acm.get_cert_object(cert_fqdn, region)
-        if cert is not None:
-            self.logger.info('{} - get_cert_object - cert: {}'.format( __name__, cert))
-        if action == 'request':
-            if not cert:
-                self.logger.info('{} - Requesting certificate for {}'.format(
-                    __name__, cert_fqdn)
-                )
-                self._handle_cert_request(cert_fqdn, subalt_names, validation_domain, region)
-
-            elif cert['Status'] == 'ISSUED':
-                self.logger.info('{} - Cert: {} - Status: {}'.format(
-                    __name__, cert_fqdn, cert['Status'])
-                )
-
-            elif cert['Status'] == 'PENDING_VALIDATION':
-                self.logger.info('{} - Cert: {} - Status: {}'.format(
-                    __name__, cert_fqdn, cert['Status'])
-                )
-                if ("ValidationMethod" in cert["DomainValidationOptions"] and
-                        cert["DomainValidationOptions"]["ValidationMethod"] == "DNS"):
-                    acm.request_validation(cert, validation_domain, region)
-
-            elif cert['Status'] == 'VALIDATION_TIMED_OUT':
-                self.logger.info('{} - Cert: {} - Status: {}'.format(
-                    __name__, cert_fqdn, cert['Status'])
-                )
-                self.logger.info('{} - Deleting certificate: {}'.format(
-                    __name__, cert['CertificateArn'])
-                )
-                acm.delete_cert(cert['CertificateArn'], region=region)
-                self.logger.info('{} - Re-requesting certificate: {}'.format(
-                    __name__, cert_fqdn)
-                )
-                self._handle_cert_request(cert_fqdn, subalt_names, validation_domain, region)
-
-            elif cert['Status'] == 'FAILED':
-                raise RuntimeError('ACM certificate request failed: {}'.format(
-                    cert['FailureReason']))
-
-            elif cert['Status'] == 'REVOKED':
-                raise RuntimeError('ACM certificate is in revoked state: {}'.format(
-                    cert['RevocationReason']))
-
-            else:
-                raise RuntimeError('ACM certificate status is {}'.format(cert['Status']))
-
-        elif action == 'delete':
-            if cert:
-                self.logger.info('{} - Deleting certificate: {}'.format(
-                    __name__, cert['CertificateArn'])
-                )
-                acm.delete_cert(cert['CertificateArn'], region=region)
-
-            # clean up route53 certificate validation CNAME entry
-            if not cert_fqdn.endswith('.'):
-                cert_fqdn += '.'
-            validation_cname_pattern=re.compile(r'_\w{32}\.' + re.escape(cert_fqdn))
-            record_set = route53.get_resource_record_set(
-                hosted_zone=validation_domain,
-                record_type='CNAME',
-                pattern=validation_cname_pattern,
-            )
-            if isinstance(record_set, list):
-                raise RuntimeError('multiple certificate validation CNAME record sets '
-                'found matching "{}"'.format(cert_fqdn)
-            )
-            if record_set:
-                self.logger.info('{} - Deleting route53 certificate validation '
-                    'CNAME: {}'.format(__name__, cert_fqdn)
-                )
-                route53.change_record_set(record_set, validation_domain, 'DELETE')
-
-        else:
+        if action not in ('request', 'delete'):
             raise InvalidHookArgumentSyntaxError(
                 '{}: value of kwarg "action" must be one of '
                 '"request, delete"'.format(__name__)
             )
+        cert_specs = self._parse_cert_specs()
+        region = self.argument['region']
+        timeout = int(self.argument.get('timeout', acm.ISSUE_TIMEOUT))
+        use_waiter = str(self.argument.get('use_waiter', '')).lower() == 'true'
+        self.logger.info('{} -  parsed args:- action: {}, certificates: {}, region: {}'.format(__name__, action, cert_specs, region))
+
+        # determine certificate status and handle accordingly
+        connection_manager = clients.stack_connection_manager(self.stack)
+        to_request = []
+        for cert_spec in cert_specs:
+            cert = acm.get_cert_object(cert_spec['cert_fqdn'], region, connection_manager)
+            if cert is not None:
+                self.logger.info('{} - get_cert_object - cert: {}'.format( __name__, cert))
+            if action == 'request':
+                if self._check_cert(cert_spec, cert, region, connection_manager):
+                    to_request.append(cert_spec)
+            else:
+                self._delete_cert(cert_spec, cert, region, connection_manager)
+        if to_request:
+            self._handle_cert_requests(to_request, region, timeout, use_waiter)
 
 
 def main():
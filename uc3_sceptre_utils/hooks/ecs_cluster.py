@@ -1,39 +1,43 @@
 # -*- coding: utf-8 -*-
 from sceptre.hooks import Hook
+from uc3_sceptre_utils.util import clients, ensure, metrics
 
 
 class ECSCluster(Hook):
     """
     Check if the specified ecs cluster exists.  If not, create it.
+    Done once per cluster name, account and region, however many stacks
+    run the hook (see util/ensure.py).
     """
 
     def __init__(self, *args, **kwargs):
         super(ECSCluster, self).__init__(*args, **kwargs)
 
+    @metrics.scoped
     def run(self):
         cluster_name = self.argument
-        response = self.stack.connection_manager.call(
-            service="ecs",
-            command="describe_clusters",
-            kwargs=dict(
-                clusters=[cluster_name]
-            )
+        return ensure.ensure(__name__, cluster_name, self.stack,
+                             lambda: self._ensure_cluster(cluster_name))
+
+    def _ensure_cluster(self, cluster_name):
+        """
+        Return the ARN of the active cluster, creating it if needed.
+        """
+        ecs_client = clients.get_client(
+            "ecs", connection_manager=self.stack.connection_manager
         )
+        response = ecs_client.describe_clusters(clusters=[cluster_name])
         if (response['clusters'] 
             and response['clusters'][0]["status"] == 'ACTIVE'
         ):
             self.logger.debug("{} - Found Active ECS Cluster: {}".format(
                 __name__, response['clusters'][0]["clusterArn"])
             )
+            return response['clusters'][0]["clusterArn"]
         else:
-            response = self.stack.connection_manager.call(
-                service="ecs",
-                command="create_cluster",
-                kwargs=dict(
-                    clusterName=cluster_name
-                )
-            )
+            response = ecs_client.create_cluster(clusterName=cluster_name)
             self.logger.debug("{} - Created ECS Cluster {}".format(
                 __name__, response["cluster"]["clusterArn"])
             )
+            return response["cluster"]["clusterArn"]
 
@@ -3,6 +3,7 @@ import json
 
 from botocore.exceptions import ClientError
 from sceptre.hooks import Hook
+from uc3_sceptre_utils.util import clients, ensure, metrics
 
 
 
@@ -10,24 +11,34 @@ class ECSTaskExecRole(Hook):
     """
     Check if the ecsTaskExecutionRole IAM role exists.  If not,
     create it and attach policy AmazonECSTaskExecutionRolePolicy.
+    Done once per account, however many stacks run the hook (see
+    util/ensure.py).
     """
 
     def __init__(self, *args, **kwargs):
         super(ECSTaskExecRole, self).__init__(*args, **kwargs)
 
+    @metrics.scoped
     def run(self):
         role_name = "ecsTaskExecutionRole"
+        return ensure.ensure(__name__, role_name, self.stack,
+                             lambda: self._ensure_role(role_name))
+
+    def _ensure_role(self, role_name):
+        """
+        Return the ARN of the role, creating it if needed.
+        """
         policy_arn = "arn:aws:iam::aws:policy/service-role/AmazonECSTaskExecutionRolePolicy"
 
+        iam_client = clients.get_client(
+            "iam", connection_manager=self.stack.connection_manager
+        )
         try:
-            response = self.stack.connection_manager.call(
-                service="iam",
-                command="get_role",
-                kwargs=dict(RoleName=role_name)
-            )
+            response = iam_client.get_role(RoleName=role_name)
             self.logger.debug("{} - Found role: {}".format(
                 __name__, response["Role"]["Arn"])
             )
+            return response["Role"]["Arn"]
 
         except ClientError as e:
             if e.response["Error"]["Code"] == "NoSuchEntity":
@@ -45,24 +56,18 @@ class ECSTaskExecRole(Hook):
                     ]
                 })
 
-                new_role = self.stack.connection_manager.call(
-                    service="iam",
-                    command="create_role",
-                    kwargs=dict(
-                        RoleName=role_name,
-                        AssumeRolePolicyDocument=policy_doc,
-                    )
+                new_role = iam_client.create_role(
+                    RoleName=role_name,
+                    AssumeRolePolicyDocument=policy_doc,
                 )["Role"]
 
-                self.stack.connection_manager.call(
-                    service="iam",
-                    command="attach_role_policy",
-                    kwargs=dict(
-                        RoleName=role_name,
-                        PolicyArn=policy_arn,
-                    )
+                iam_client.attach_role_policy(
+                    RoleName=role_name,
+                    PolicyArn=policy_arn,
                 )
 
                 self.logger.debug("{} - Created role: {}".format(
                     __name__, new_role["Arn"])
                 )
+                return new_role["Arn"]
+            raise
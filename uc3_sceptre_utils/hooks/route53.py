@@ -4,11 +4,14 @@ import re
 
 from sceptre.hooks import Hook
 from sceptre.exceptions import InvalidHookArgumentSyntaxError
+from uc3_sceptre_utils.util import clients, ensure, metrics, route53
 
 
 class Route53HostedZone(Hook):
     """
     Check if the specified route53 hosted zone exists.  If not, create it.
+    Stacks running the hook for the same zone at the same time wait for
+    the first one, so the zone is created only once (see util/ensure.py).
     """
 
     def __init__(self, *args, **kwargs):
@@ -20,6 +23,7 @@ class Route53HostedZone(Hook):
         """
         return full_zone_id.split("/")[2]
 
+    @metrics.scoped
     def run(self):
         """
         Check if a route53 hosted zone exists for the domain name passed
@@ -39,40 +43,40 @@ class Route53HostedZone(Hook):
         zone_name = self.argument
         if not zone_name.endswith("."):
             zone_name += "."
+        return ensure.ensure(__name__, zone_name, self.stack,
+                             lambda: self._ensure_zone(zone_name))
 
+    def _ensure_zone(self, zone_name):
+        """
+        Return the id of the hosted zone, creating it if needed.
+        """
         # check if zone already exists
-        response = self.stack.connection_manager.call(
-            service="route53",
-            command="list_hosted_zones",
+        connection_manager = self.stack.connection_manager
+        zone_id = (
+            route53.get_hosted_zone_id(
+                zone_name, connection_manager=connection_manager)
+            or route53.get_hosted_zone_id(
+                zone_name, private_zone=True, connection_manager=connection_manager)
         )
-        hosted_zones = response["HostedZones"]
-        while response["IsTruncated"]:
-            response = self.stack.connection_manager.call(
-                service="route53",
-                command="list_hosted_zones",
-                kwargs=dict(Marker=reponse["NextMarker"]),
+        if zone_id:
+            self.logger.debug(
+                '{} - Found hosted zone "{}" with zone id "{}"'.format(
+                __name__, zone_name, zone_id)
             )
-            hosted_zones += response["HostedZones"]
-        for zone in hosted_zones:
-            if zone["Name"] == zone_name:
-                zone_id = self.parse_zone_id(zone["Id"])
-                self.logger.debug(
-                    '{} - Found hosted zone "{}" with zone id "{}"'.format(
-                    __name__, zone_name, zone_id)
-                )
-                return zone_id
+            return zone_id
 
         # create new hosted zone
         reference = uuid.uuid4().hex
-        response = self.stack.connection_manager.call(
-            service="route53",
-            command="create_hosted_zone",
-            kwargs=dict(
-                Name=zone_name,
-                CallerReference=reference,
-            )
+        route53_client = clients.get_client(
+            "route53", connection_manager=connection_manager
+        )
+        response = route53_client.create_hosted_zone(
+            Name=zone_name,
+            CallerReference=reference,
         )
         zone_id = self.parse_zone_id(response["HostedZone"]["Id"])
+        # the new zone is missing from any cached zone listing
+        route53.invalidate_hosted_zone_index()
         self.logger.debug(
             '{} - Created hosted zone "{}" with zone id "{}"'.format(
             __name__, zone_name, zone_id)
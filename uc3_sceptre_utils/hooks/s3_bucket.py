@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 import sys
-import boto3
 
 from sceptre.hooks import Hook
 from sceptre.cli.helpers import setup_logging
 from sceptre.exceptions import SceptreException
 from sceptre.exceptions import InvalidHookArgumentSyntaxError
+from botocore.exceptions import ClientError
+from uc3_sceptre_utils.util import clients, metrics, s3 as s3_util
 
 DEFAULT_REGION = 'us-west-2'
 
@@ -19,15 +20,34 @@ class S3Bucket(Hook):
 
     :bucket_name:   Required. The name of a s3 bucket.
     :action:        Required. The action to perform on a 3s bucket.
-                    Must be one of "create", "empty", or "delete".
+                    Must be one of "create", "empty", "delete" or "check".
     :region:        The AWS region in which to create a bucket.
                     Default: us-west-2.
+    :workers:       Concurrent DeleteObjects requests for "empty" and
+                    "delete", from 1 to 50 (the client's connection pool).
+                    Default: 16.
+    :mode:          How "empty" and "delete" remove objects: "api" (the
+                    default) deletes them now, "lifecycle" installs a
+                    lifecycle configuration expiring everything and returns
+                    right away.
 
     Example:
         !s3_bucket action=create bucket_name=mybucket region=us-west-2
 
     Notes:  The "empty" and "delete" actions recusively remove all objects
             and object versions from a bucket, no questions asked.  Take care!
+            Keys are listed by prefix in parallel and deleted in concurrent
+            batches, with progress logged as it goes.  Keys that could not
+            be deleted are reported and fail the hook.  A bucket that does
+            not exist is left alone.
+
+            With mode=lifecycle, S3 expires the objects in the background
+            over the next days, free of request charges.  This replaces any
+            lifecycle configuration of the bucket.  "delete" deletes the
+            bucket only once it is empty, so rerun it (e.g. with the next
+            'sceptre delete') to finish.  The "check" action logs how many
+            keys remain, from a single ListObjectVersions request, and
+            whether the expire-all lifecycle rules are installed.
 
             If a bucket already exists, the "create" action does nothing.
     """
@@ -35,6 +55,7 @@ class S3Bucket(Hook):
     def __init__(self, *args, **kwargs):
         super(S3Bucket, self).__init__(*args, **kwargs)
 
+    @metrics.scoped
     def run(self):
         kwargs = dict()
         for item in self.argument.split():
@@ -47,10 +68,24 @@ class S3Bucket(Hook):
                     '{}: required kwarg "{}" not found'.format(__name__, arg)
                 )
 
-        s3 = boto3.resource('s3')
-        bucket = s3.Bucket(kwargs['bucket_name'])
         action = kwargs['action']
         region = kwargs.get('region', DEFAULT_REGION)
+        workers = kwargs.get('workers', str(s3_util.DELETE_WORKERS))
+        if not workers.isdigit() or not 1 <= int(workers) <= clients.MAX_POOL_CONNECTIONS:
+            raise InvalidHookArgumentSyntaxError(
+                '{}: value of kwarg "workers" must be a number from 1 to {}'.format(
+                    __name__, clients.MAX_POOL_CONNECTIONS)
+            )
+        workers = int(workers)
+        mode = kwargs.get('mode', 'api')
+        if mode not in ('api', 'lifecycle'):
+            raise InvalidHookArgumentSyntaxError(
+                '{}: value of kwarg "mode" must be one of '
+                '"api, lifecycle"'.format(__name__)
+            )
+        connection_manager = clients.stack_connection_manager(self.stack)
+        s3 = clients.get_resource('s3', connection_manager=connection_manager)
+        bucket = s3.Bucket(kwargs['bucket_name'])
 
         if action == 'create':
             bucket.load()
@@ -69,38 +104,58 @@ class S3Bucket(Hook):
                     "{} - Found S3 Bucket: {}".format(__name__, bucket.name)
                 )
 
-        elif action == 'empty':
-            bucket.load()
-            self.logger.debug(
-                "{} - Deleting contents of S3 Bucket: {}".format(__name__, bucket.name)
-            )
+        elif action in ('empty', 'delete', 'check'):
             try:
-                bucket.objects.delete()
-                bucket.object_versions.delete()
-            except Exception as e:
-                self.logger.debug(
-                    "{} - {}".format(__name__, e)
-                )
-
-        elif action == 'delete':
-            bucket.load()
-            self.logger.debug(
-                "{} - Deleting S3 Bucket: {}".format(__name__, bucket.name)
-            )
-            try:
-                bucket.objects.delete()
-                bucket.object_versions.delete()
-                bucket.delete()
-            except Exception as e:
+                if action == 'check':
+                    self._log_remaining(bucket.name, connection_manager)
+                    return
+                if mode == 'lifecycle':
+                    self.logger.info(
+                        "{} - Setting expire-all lifecycle rules on S3 Bucket: {}".format(
+                            __name__, bucket.name)
+                    )
+                    s3_util.set_expire_all_lifecycle(
+                        bucket.name, connection_manager=connection_manager)
+                    remaining = self._log_remaining(bucket.name, connection_manager)
+                    if action == 'empty' or remaining.keys or remaining.uploads:
+                        return
+                else:
+                    self.logger.debug(
+                        "{} - Deleting contents of S3 Bucket: {}".format(__name__, bucket.name)
+                    )
+                    s3_util.empty_bucket(bucket.name, connection_manager=connection_manager,
+                                         workers=workers, log=self.logger)
+                if action == 'delete':
+                    self.logger.debug(
+                        "{} - Deleting S3 Bucket: {}".format(__name__, bucket.name)
+                    )
+                    bucket.delete()
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'NoSuchBucket':
+                    raise
                 self.logger.debug(
-                    "{} - {}".format(__name__, e)
+                    "{} - S3 Bucket not found: {}".format(__name__, bucket.name)
                 )
 
         else:
             raise InvalidHookArgumentSyntaxError(
                 '{}: value of kwarg "action" must be one of '
-                '"create, empty, delete"'.format(__name__)
+                '"create, empty, delete, check"'.format(__name__)
+            )
+
+    def _log_remaining(self, bucket_name, connection_manager):
+        remaining = s3_util.count_remaining(bucket_name, connection_manager=connection_manager)
+        self.logger.info(
+            "{} - S3 Bucket {}: {}{} keys and {}{} incomplete uploads remaining, "
+            "expire-all lifecycle rules {}".format(
+                __name__, bucket_name,
+                'over ' if remaining.truncated else '', remaining.keys,
+                'at least ' if remaining.uploads >= s3_util.REMAINING_PROBE_KEYS else '',
+                remaining.uploads,
+                'installed' if remaining.expire_all else 'not installed',
             )
+        )
+        return remaining
 
 
 def main():
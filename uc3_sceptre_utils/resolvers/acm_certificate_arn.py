@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from sceptre.resolvers import Resolver
 from sceptre.exceptions import InvalidHookArgumentSyntaxError
-from uc3_sceptre_utils.util import acm
+from uc3_sceptre_utils.util import acm, cache, clients, metrics
 
 DEFAULT_REGION = 'us-east-1'
 
@@ -20,6 +20,7 @@ class AcmCertificateArn(Resolver):
     def __init__(self, *args, **kwargs):
         super(AcmCertificateArn, self).__init__(*args, **kwargs)
 
+    @metrics.scoped
     def resolve(self):
         if len(self.argument.split()) == 2:
             cert_fqdn, region = self.argument.split()
@@ -32,7 +33,13 @@ class AcmCertificateArn(Resolver):
                 'cert_fqdn [region]'.format(__name__)
             )
 
-        arn = acm.get_cert_arn(cert_fqdn, region)
+        arn = cache.resolve_cached(
+            'acm_certificate_arn', cert_fqdn, region, self.stack,
+            lambda: acm.get_cert_arn(
+                cert_fqdn, region,
+                connection_manager=clients.stack_connection_manager(self.stack),
+            ),
+        )
         if not arn:
             arn = str()
         self.logger.debug('{} - certificate_arn: {}'.format(__name__, arn))
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from sceptre.resolvers import Resolver
 from sceptre.exceptions import InvalidHookArgumentSyntaxError
-from uc3_sceptre_utils.util import route53
+from uc3_sceptre_utils.util import cache, clients, metrics, route53
 
 
 class HostedZoneId(Resolver):
@@ -18,6 +18,7 @@ class HostedZoneId(Resolver):
     def __init__(self, *args, **kwargs):
         super(HostedZoneId, self).__init__(*args, **kwargs)
 
+    @metrics.scoped
     def resolve(self):
         self.logger.info('{} - self.stack: {}'.format(__name__, self.stack))
         self.logger.info('{} - self.argument: {}'.format(__name__, self.argument))
@@ -36,7 +37,13 @@ class HostedZoneId(Resolver):
             )
 
         #self.logger.info('{} - region: {}'.format(__name__, region))
-        hosted_zone_id = route53.get_hosted_zone_id(domain_name, region)
+        hosted_zone_id = cache.resolve_cached(
+            'hosted_zone_id', domain_name, region, self.stack,
+            lambda: route53.get_hosted_zone_id(
+                domain_name, region,
+                connection_manager=clients.stack_connection_manager(self.stack),
+            ),
+        )
         if not hosted_zone_id:
             hosted_zone_id = str()
         self.logger.info('{} - hosted_zone_id: {}'.format(__name__, hosted_zone_id))
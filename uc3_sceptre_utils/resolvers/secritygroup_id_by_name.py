@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-import boto3
 from sceptre.resolvers import Resolver
 from sceptre.exceptions import InvalidHookArgumentSyntaxError
+from uc3_sceptre_utils.util import cache, clients, ec2, metrics
 
 
 class SecurityGroupIdByName(Resolver):
@@ -11,38 +11,55 @@ class SecurityGroupIdByName(Resolver):
 
     Example sceptre config usage:
         default_sg: !securitygroup_id_by_name default
+        app_sg: !securitygroup_id_by_name app-SecGrp vpc-0123456789abcdef0
+
+    Names are looked up in batches: every !securitygroup_id_by_name of the
+    stack group is collected when the resolvers are set up, and fetched in
+    one call per region and VPC.
 
     Parameters
     ----------
-    argument: sg_name
-        The name of the ec2 security group
+    argument: sg_name [vpc_id]
+        The name of the ec2 security group, and optionally the Id of the VPC
+        it belongs to.  The VPC Id is required when the name is used in more
+        than one VPC.
     stack: sceptre.stack.Stack
     """
 
     def __init__(self, argument, stack=None):
         super(SecurityGroupIdByName, self).__init__(argument, stack)
 
-    def resolve(self):
-        if len(self.argument.split()) == 1:
-            sg_name = self.argument
-        else:
+    def _parse_argument(self):
+        args = self.argument.split()
+        if len(args) not in (1, 2):
             raise InvalidHookArgumentSyntaxError(
-                '{}: resolver requires one positional parameter: '
-                'parameter_name'.format(__name__)
-            )
-        ec2_client = boto3.client('ec2')
-        try:
-            response = ec2_client.describe_security_groups(
-                Filters=[
-                    {
-                        'Name': 'group-name',
-                        'Values': [sg_name],
-                    }
-                ]
+                '{}: resolver requires one or two positional parameters: '
+                'sg_name [vpc_id]'.format(__name__)
             )
-        except Exception:
+        sg_name = args[0]
+        vpc_id = args[1] if len(args) == 2 else None
+        return sg_name, vpc_id
+
+    @metrics.scoped
+    def setup(self):
+        sg_name, vpc_id = self._parse_argument()
+        ec2.register_security_group_name(
+            sg_name, vpc_id, self.stack.region,
+            connection_manager=clients.stack_connection_manager(self.stack),
+        )
+
+    @metrics.scoped
+    def resolve(self):
+        sg_name, vpc_id = self._parse_argument()
+        value = cache.resolve_cached(
+            'securitygroup_id_by_name', self.argument, self.stack.region, self.stack,
+            lambda: ec2.get_security_group_id(
+                sg_name, vpc_id, self.stack.region,
+                connection_manager=clients.stack_connection_manager(self.stack),
+            ),
+        )
+        if value is None:
             self.logger.info('{} - securitygroup name not found: {}'.format(__name__, sg_name))
             return None
-        value = response['SecurityGroups'][0]['GroupId']
         self.logger.info('{} - securitygroup id for {}: {}'.format(__name__, sg_name, value))
         return value
@@ -1,23 +1,154 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import os
+import threading
 import time
-import boto3
-from uc3_sceptre_utils.util import route53, DEFAULT_REGION
+from concurrent.futures import ThreadPoolExecutor
 
+from botocore.exceptions import WaiterError
+from uc3_sceptre_utils.util import clients, listing, metrics, poll, route53, DEFAULT_REGION
 
-def get_cert_arn(cert_fqdn, region=DEFAULT_REGION):
+# seconds the certificates of an account are served from memory.  Those
+# requested or deleted through this module are updated in place, so this
+# only matters for certificates managed elsewhere, e.g. by CloudFormation.
+ACM_INDEX_TTL = int(os.environ.get('UC3_SCEPTRE_ACM_INDEX_TTL', 900))
+
+# seconds to wait for ACM to publish DNS validation records
+RESOURCE_RECORD_TIMEOUT = 120
+# seconds to wait for a DNS validated certificate to be issued
+ISSUE_TIMEOUT = 300
+# seconds between checks of the certificate_validated waiter
+WAITER_DELAY = 15
+# most certificates requested or waited for at the same time
+MAX_WORKERS = 10
+
+# list_certificates filters.  Without 'keyTypes' ACM lists RSA_2048
+# certificates only.
+CERTIFICATE_STATUSES = [
+    'PENDING_VALIDATION',
+    'ISSUED',
+    'INACTIVE',
+    'EXPIRED',
+    'VALIDATION_TIMED_OUT',
+    'REVOKED',
+    'FAILED',
+]
+CERTIFICATE_KEY_TYPES = [
+    'RSA_1024',
+    'RSA_2048',
+    'RSA_3072',
+    'RSA_4096',
+    'EC_prime256v1',
+    'EC_secp384r1',
+    'EC_secp521r1',
+]
+
+
+class _CertificateListing(object):
+    """
+    The certificates of one (account, region), by domain name and by
+    subject alternative name.
+    """
+
+    def __init__(self):
+        self.domains = {}
+        self.sans = {}
+
+    def add(self, arn, domain_name, subalt_names=()):
+        self.domains.setdefault(domain_name.lower(), set()).add(arn)
+        for name in subalt_names:
+            self.sans.setdefault(name.lower(), set()).add(arn)
+
+    def remove(self, arn):
+        for names in (self.domains, self.sans):
+            for arns in names.values():
+                arns.discard(arn)
+
+
+class CertificateIndex(object):
+    """
+    Process-wide index of ACM certificates.
+
+    Certificates are listed once per (account, region), filtered server
+    side by 'statuses' and 'key_types', and indexed by DomainName and
+    SubjectAlternativeNames.  Certificates requested or deleted through
+    this module are added to or removed from the index as it happens, so
+    it never needs a re-list to see them.  Listings expire as described in
+    util/listing.py.
+    """
+
+    def __init__(self, ttl=ACM_INDEX_TTL, statuses=CERTIFICATE_STATUSES,
+                 key_types=CERTIFICATE_KEY_TYPES, miss_reload_age=listing.MISS_RELOAD_AGE):
+        self.statuses = statuses
+        self.key_types = key_types
+        # guards the listings, which add() and remove() change in place
+        self._lock = threading.Lock()
+        self._listings = listing.ListingCache(ttl, miss_reload_age)
+
+    def _load(self, region, connection_manager):
+        acm_client = clients.get_client('acm', region, connection_manager=connection_manager)
+        paginator = acm_client.get_paginator('list_certificates')
+        certificates = _CertificateListing()
+        pages = paginator.paginate(
+            CertificateStatuses=self.statuses,
+            Includes=dict(keyTypes=self.key_types),
+        )
+        for page in pages:
+            for cert in page['CertificateSummaryList']:
+                certificates.add(
+                    cert['CertificateArn'],
+                    cert['DomainName'],
+                    cert.get('SubjectAlternativeNameSummaries', []),
+                )
+        return certificates
+
+    def _listing(self, region, connection_manager, found=None):
+        account_id = clients.get_account_id(region, connection_manager=connection_manager)
+        return self._listings.get(
+            (account_id, region), lambda: self._load(region, connection_manager), found)
+
+    @staticmethod
+    def _find(certificates, domain_name, include_sans):
+        arns = set(certificates.domains.get(domain_name, ()))
+        if include_sans:
+            arns.update(certificates.sans.get(domain_name, ()))
+        return arns
+
+    def find(self, domain_name, region=DEFAULT_REGION, connection_manager=None,
+             include_sans=False):
+        """
+        Return the sorted ARNs of certificates for 'domain_name'.  With
+        'include_sans', also those naming it as a subject alternative name.
+        """
+        domain_name = domain_name.lower()
+        with self._lock:
+            certificates = self._listing(
+                region, connection_manager,
+                lambda certificates: self._find(certificates, domain_name, include_sans))
+            arns = self._find(certificates, domain_name, include_sans)
+        return sorted(arns)
+
+    def add(self, arn, domain_name, subalt_names=(), region=DEFAULT_REGION,
+            connection_manager=None):
+        with self._lock:
+            self._listing(region, connection_manager).add(arn, domain_name, subalt_names)
+
+    def remove(self, arn, region=DEFAULT_REGION, connection_manager=None):
+        with self._lock:
+            self._listing(region, connection_manager).remove(arn)
+
+    def invalidate(self):
+        self._listings.invalidate()
+
+
+_certificate_index = CertificateIndex()
+
+
+def get_cert_arn(cert_fqdn, region=DEFAULT_REGION, connection_manager=None):
     """
     Return the ACM Certificate ARN for 'cert_fqdn'.
     """
-    acm_client = boto3.client('acm', region_name=region)
-    response = acm_client.list_certificates()
-    cert_list = response['CertificateSummaryList']
-    while 'NextToken' in response:
-        response = acm_client.list_certificates(NextToken=response['NextToken'])
-        cert_list += response['CertificateSummaryList']
-    arn_list = [
-        cert['CertificateArn'] for cert in cert_list
-        if cert['DomainName'] == cert_fqdn
-    ]
+    arn_list = _certificate_index.find(cert_fqdn, region, connection_manager)
     if len(arn_list) > 1:
         raise RuntimeError(
             "Found multiple matching ACM certificates: {}".format(arn_list)
@@ -27,66 +158,199 @@ def get_cert_arn(cert_fqdn, region=DEFAULT_REGION):
     return arn_list[0]
 
 
-def get_cert_object(cert_fqdn, region=DEFAULT_REGION):
+def get_cert_arns_for_name(domain_name, region=DEFAULT_REGION, connection_manager=None):
+    """
+    Return the ARNs of all certificates valid for 'domain_name', either as
+    their domain name or as a subject alternative name.
+    """
+    return _certificate_index.find(
+        domain_name, region, connection_manager, include_sans=True)
+
+
+def describe_cert(cert_arn, region=DEFAULT_REGION, connection_manager=None):
+    """
+    Return the ACM certificate object for 'cert_arn'.
+    """
+    acm_client = clients.get_client('acm', region, connection_manager=connection_manager)
+    return acm_client.describe_certificate(CertificateArn=cert_arn)['Certificate']
+
+
+def get_cert_object(cert_fqdn, region=DEFAULT_REGION, connection_manager=None):
     """
     Return the ACM certificate object for 'cert_fqdn'.
     """
-    acm_client = boto3.client('acm', region_name=region)
-    certificate_arn = get_cert_arn(cert_fqdn, region)
+    certificate_arn = get_cert_arn(cert_fqdn, region, connection_manager)
     if certificate_arn:
-        return acm_client.describe_certificate(
-            CertificateArn=certificate_arn
-        )['Certificate']
+        return describe_cert(certificate_arn, region, connection_manager)
     else:
         return None
 
 
-def request_cert(cert_fqdn, subalt_names, validation_domain, region=DEFAULT_REGION):
+def _idempotency_token(cert_fqdn):
+    # distinct per certificate, so concurrent requests are not merged
+    return hashlib.sha1(cert_fqdn.encode('utf-8')).hexdigest()[:32]
+
+
+def _request_certificate(cert_fqdn, subalt_names, validation_domain, region,
+                         connection_manager):
     """
-    Create a ACM certificate request.  Create validation record set in route53.
-    'validation_domain' must match a valid Route53 HostedZone. 
+    Create a DNS validated ACM certificate request, and wait for ACM to
+    publish the validation records of all its domain names.  Return the
+    certificate object.
     """
-    hosted_zone_id = route53.get_hosted_zone_id(validation_domain, region)
+    hosted_zone_id = route53.get_hosted_zone_id(
+        validation_domain, region, connection_manager=connection_manager)
     if hosted_zone_id is not None:
         validation_method = 'DNS'
     else:
         raise RuntimeError(
                 "No Route53 HostedZone matches 'validation_domain: {}".format(validation_domain))
-    acm_client = boto3.client('acm', region_name=region)
+    acm_client = clients.get_client('acm', region, connection_manager=connection_manager)
     domain_validation_options = [
             dict(DomainName=cert_fqdn, ValidationDomain=validation_domain)]
     for domain in subalt_names:
         domain_validation_options.append(dict(DomainName=domain, ValidationDomain=validation_domain))
-    response = acm_client.request_certificate(
+    request_kwargs = dict(
         DomainName=cert_fqdn,
         ValidationMethod=validation_method,
-        SubjectAlternativeNames=subalt_names,
-        IdempotencyToken='request_cert',
+        IdempotencyToken=_idempotency_token(cert_fqdn),
         DomainValidationOptions=domain_validation_options,
     )
+    if subalt_names:
+        request_kwargs['SubjectAlternativeNames'] = subalt_names
+    response = acm_client.request_certificate(**request_kwargs)
     arn = response['CertificateArn']
-    cert = acm_client.describe_certificate(CertificateArn=arn)['Certificate']
-    while 'ResourceRecord' not in cert['DomainValidationOptions'][0]:
-        time.sleep(5)
-        cert = acm_client.describe_certificate(CertificateArn=arn)['Certificate']
-    cert_validation_record_set(
-        cert['DomainValidationOptions'][0]['ResourceRecord'],
-        validation_domain
+    _certificate_index.add(arn, cert_fqdn, subalt_names, region, connection_manager)
+    cert, _ = poll.poll(
+        lambda: describe_cert(arn, region, connection_manager),
+        timeout=RESOURCE_RECORD_TIMEOUT,
+        max_delay=10,
+        done=lambda cert: all(
+            'ResourceRecord' in option for option in cert['DomainValidationOptions']),
+    )
+    return cert
+
+
+def request_cert(cert_fqdn, subalt_names, validation_domain, region=DEFAULT_REGION,
+                 connection_manager=None):
+    """
+    Create a ACM certificate request.  Create validation record set in route53.
+    'validation_domain' must match a valid Route53 HostedZone. 
+    Return the ARN of the new certificate.
+    """
+    cert_spec = dict(
+        cert_fqdn=cert_fqdn,
+        subalt_names=subalt_names,
+        validation_domain=validation_domain,
+    )
+    return request_certs([cert_spec], region, connection_manager)[0]
+
+
+def request_certs(cert_specs, region=DEFAULT_REGION, connection_manager=None,
+                  max_workers=MAX_WORKERS):
+    """
+    Request several ACM certificates at once.  Return their ARNs, in the
+    order of 'cert_specs'.
+
+    Each cert spec is a dict with keys 'cert_fqdn', 'validation_domain'
+    and optionally 'subalt_names' (a list).  Certificates are requested
+    concurrently.  The validation record sets of every domain name of
+    every certificate are then created together, see
+    upsert_validation_records().
+    """
+    def request(cert_spec):
+        return _request_certificate(
+            cert_spec['cert_fqdn'],
+            cert_spec.get('subalt_names', []),
+            cert_spec['validation_domain'],
+            region,
+            connection_manager,
+        )
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(cert_specs))) as executor:
+        certs = list(executor.map(metrics.bind(request), cert_specs))
+
+    upsert_validation_records(
+        [(cert, cert_spec['validation_domain']) for cert_spec, cert in zip(cert_specs, certs)],
+        region,
+        connection_manager=connection_manager,
     )
+    return [cert['CertificateArn'] for cert in certs]
+
+
+def wait_for_cert_issued(cert_arn, region=DEFAULT_REGION, connection_manager=None,
+                         timeout=ISSUE_TIMEOUT, use_waiter=False):
+    """
+    Wait until certificate 'cert_arn' is no longer pending validation.
+    Return (certificate object, poll.PollStats).
+
+    The first check is made right away and later ones back off
+    exponentially.  With 'use_waiter', botocore's certificate_validated
+    waiter checks every WAITER_DELAY seconds instead.
+
+    :raises: poll.PollTimeout, if the certificate is still pending after
+             'timeout' seconds.
+    """
+    if not use_waiter:
+        return poll.poll(
+            lambda: describe_cert(cert_arn, region, connection_manager),
+            timeout=timeout,
+            done=lambda cert: cert['Status'] != 'PENDING_VALIDATION',
+        )
+    acm_client = clients.get_client('acm', region, connection_manager=connection_manager)
+    waiter = acm_client.get_waiter('certificate_validated')
+    max_attempts = max(1, int(timeout // WAITER_DELAY))
+    start = time.monotonic()
+    try:
+        waiter.wait(
+            CertificateArn=cert_arn,
+            WaiterConfig=dict(Delay=WAITER_DELAY, MaxAttempts=max_attempts),
+        )
+    except WaiterError:
+        # raised for failed certificates as well as timeouts
+        pass
+    cert = describe_cert(cert_arn, region, connection_manager)
+    elapsed = time.monotonic() - start
+    stats = poll.PollStats(None, elapsed, None)
+    if cert['Status'] == 'PENDING_VALIDATION':
+        raise poll.PollTimeout(
+            'gave up after {:.1f}s'.format(elapsed), cert, stats)
+    return cert, stats
+
+
+def wait_for_certs_issued(cert_arns, region=DEFAULT_REGION, connection_manager=None,
+                          timeout=ISSUE_TIMEOUT, use_waiter=False,
+                          max_workers=MAX_WORKERS):
+    """
+    Wait for several certificates at once, see wait_for_cert_issued().
+    Return a list of (certificate object, poll.PollStats), in the order of
+    'cert_arns'.  Certificates still pending after 'timeout' are returned
+    with status PENDING_VALIDATION rather than raising.
+    """
+    def wait(cert_arn):
+        try:
+            return wait_for_cert_issued(
+                cert_arn, region, connection_manager, timeout, use_waiter)
+        except poll.PollTimeout as e:
+            return e.value, e.stats
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(cert_arns))) as executor:
+        return list(executor.map(metrics.bind(wait), cert_arns))
 
 
-def delete_cert(cert_arn, region=DEFAULT_REGION):
+def delete_cert(cert_arn, region=DEFAULT_REGION, connection_manager=None):
     """Delete an existing ACM certificate."""
-    acm_client = boto3.client('acm', region_name=region)
+    acm_client = clients.get_client('acm', region, connection_manager=connection_manager)
     acm_client.delete_certificate(CertificateArn=cert_arn)
+    _certificate_index.remove(cert_arn, region, connection_manager)
     return
 
 
-def cert_validation_record_set(resource_record, validation_domain, action='UPSERT'):
+def validation_record_set(resource_record):
     """
-    Create/delete route53 record set for ACM certificate validation.
+    Return the route53 record set for an ACM validation 'resource_record'.
     """
-    record_set = {
+    return {
         'Name': resource_record['Name'],
         'Type': resource_record['Type'],
         'TTL': 300,
@@ -96,31 +360,84 @@ def cert_validation_record_set(resource_record, validation_domain, action='UPSER
             },
         ],
     }
+
+
+def validation_record_sets(certs):
+    """
+    Return {validation domain: [record set]} for the DNS validation
+    records of every domain name of 'certs', a list of (certificate
+    object, validation domain).
+
+    Domain names that share a validation CNAME (the same name in several
+    certificates, or the same SAN repeated) are listed once.  Every
+    validation domain is a route53 hosted zone, so each list can be sent
+    as one change batch.
+    """
+    record_sets = {}
+    seen = set()
+    for cert, validation_domain in certs:
+        for option in cert['DomainValidationOptions']:
+            if option.get('ValidationMethod', 'DNS') != 'DNS':
+                continue
+            if 'ResourceRecord' not in option:
+                continue
+            zone_name = route53.normalize_zone_name(validation_domain)
+            record = option['ResourceRecord']
+            key = (zone_name, record['Name'], record['Type'], record['Value'])
+            if key in seen:
+                continue
+            seen.add(key)
+            record_sets.setdefault(zone_name, []).append(validation_record_set(record))
+    return record_sets
+
+
+def upsert_validation_records(certs, region=DEFAULT_REGION, connection_manager=None,
+                              wait=False):
+    """
+    Create the DNS validation records of every domain name of 'certs', a
+    list of (certificate object, validation domain), with one route53
+    change batch per hosted zone.  With 'wait', return once route53 has
+    applied them.
+    """
+    batch = route53.ChangeBatch('acm cert validation', region, connection_manager)
+    for zone_name, record_sets in validation_record_sets(certs).items():
+        for record_set in record_sets:
+            batch.add('UPSERT', record_set, hosted_zone=zone_name)
+    return batch.submit(wait=wait)
+
+
+def cert_validation_record_set(resource_record, validation_domain, action='UPSERT',
+                               connection_manager=None):
+    """
+    Create/delete route53 record set for ACM certificate validation.
+    """
     route53.change_record_set(
-        record_set,
+        validation_record_set(resource_record),
         validation_domain,
         action,
         'acm cert validation',
+        connection_manager=connection_manager,
     )
 
 
-def request_validation(cert, validation_domain, region=DEFAULT_REGION):
+def request_validation(cert, validation_domain, region=DEFAULT_REGION,
+                       connection_manager=None):
     """
     Resubmit certificate validation request based upon the validation
     options of a certificate (i.e. method is either DNS or EMAIL).
+    Validation records of all DNS validated domain names are upserted in
+    one change batch per hosted zone, and validation email is resent for
+    each EMAIL validated domain name.
     """
-    validation_options = cert['DomainValidationOptions'][0]
-    if validation_options['ValidationMethod'] == 'DNS':
-        route53.create_validation_record_set(
-            validation_options['ResourceRecord'],
-            validation_domain,
-            region,
-        )
-    else:
-        acm_client = boto3.client('acm', region_name=region)
-        acm_client.resend_validation_email(
-            CertificateArn=cert['CertificateArn'],
-            Domain=cert['DomainName'],
-            ValidationDomain=validation_domain,
-        )
+    upsert_validation_records(
+        [(cert, validation_domain)], region, connection_manager=connection_manager)
+    acm_client = clients.get_client('acm', region, connection_manager=connection_manager)
+    for validation_options in cert['DomainValidationOptions']:
+        if validation_options.get('ValidationMethod') == 'EMAIL':
+            acm_client.resend_validation_email(
+                CertificateArn=cert['CertificateArn'],
+                Domain=validation_options['DomainName'],
+                ValidationDomain=validation_options.get(
+                    'ValidationDomain', validation_domain),
+            )
     return
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Optional on-disk cache for resolver values.
+
+Values such as hosted zone ids, certificate ARNs and security group ids
+almost never change, so repeated 'sceptre generate/validate/diff' runs
+can reuse them instead of calling AWS once per resolver per stack.
+Entries are keyed by resolver name, argument, account and region and
+stored in a JSON file.
+
+The cache is off unless UC3_SCEPTRE_CACHE is set, either to a file path
+or to "1" for '.uc3-sceptre-cache.json' in the sceptre project directory.
+
+:UC3_SCEPTRE_CACHE_TTL:           seconds a found value is reused (default 1 day)
+:UC3_SCEPTRE_CACHE_NEGATIVE_TTL:  seconds a not-found result is reused (default 5 min)
+:UC3_SCEPTRE_CACHE_REFRESH:       set to "1" to ignore cached values and
+                                  re-read (and re-cache) them from AWS
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from uc3_sceptre_utils.util import clients
+
+CACHE_FILENAME = '.uc3-sceptre-cache.json'
+CACHE_TTL = int(os.environ.get('UC3_SCEPTRE_CACHE_TTL', 86400))
+CACHE_NEGATIVE_TTL = int(os.environ.get('UC3_SCEPTRE_CACHE_NEGATIVE_TTL', 300))
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _enabled_setting(name):
+    return os.environ.get(name, '').lower() not in ('', '0', 'false', 'no')
+
+
+class ResolverCache(object):
+    """
+    A JSON file of {key: {"value": ..., "expires": epoch seconds}}.
+
+    The file is read on first use and rewritten atomically after each
+    change, so an interrupted run never leaves a truncated cache behind.
+    """
+
+    def __init__(self, path, ttl=CACHE_TTL, negative_ttl=CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                # missing or unreadable cache: start over
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.uc3-sceptre-cache.')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        """
+        Return (True, value) for a live entry, otherwise (False, None).
+        """
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is None or entry['expires'] < time.time():
+            return False, None
+        return True, entry['value']
+
+    def put(self, key, value):
+        """
+        Store 'value'.  Empty values are negative results and expire sooner.
+        """
+        ttl = self.ttl if value else self.negative_ttl
+        with self._lock:
+            entries = self._load()
+            entries[key] = dict(value=value, expires=time.time() + ttl)
+            # drop expired entries while rewriting the file anyway
+            now = time.time()
+            for stale in [k for k, e in entries.items() if e['expires'] < now]:
+                del entries[stale]
+            self._save()
+
+
+def cache_key(resolver_name, argument, account_id, region):
+    return '|'.join((resolver_name, argument, account_id, region))
+
+
+def get_cache(stack=None, setting_name='UC3_SCEPTRE_CACHE', filename=CACHE_FILENAME,
+              ttl=CACHE_TTL):
+    """
+    Return the ResolverCache for the project of 'stack', or None if
+    caching is not enabled.  'setting_name', 'filename' and 'ttl' allow
+    other caches with the same semantics, see util/ensure.py.
+    """
+    setting = os.environ.get(setting_name, '')
+    if not _enabled_setting(setting_name):
+        return None
+    if setting.lower() in ('1', 'true', 'yes'):
+        stack_group_config = getattr(stack, 'stack_group_config', None) or {}
+        project_path = stack_group_config.get('project_path', os.getcwd())
+        path = os.path.join(project_path, filename)
+    else:
+        path = os.path.expanduser(setting)
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = ResolverCache(path, ttl=ttl)
+        return _caches[path]
+
+
+def stack_account_id(stack):
+    """
+    Return the AWS account Id of 'stack'.  Use the 'account_id' of the
+    stack group config when set, which lets cached runs work offline.
+    """
+    stack_group_config = getattr(stack, 'stack_group_config', None) or {}
+    if stack_group_config.get('account_id'):
+        return str(stack_group_config['account_id'])
+    return clients.get_account_id(
+        connection_manager=clients.stack_connection_manager(stack))
+
+
+def resolve_cached(resolver_name, argument, region, stack, lookup):
+    """
+    Return the cached value for (resolver_name, argument, account, region),
+    calling 'lookup()' and caching its result on a miss.
+    """
+    cache = get_cache(stack)
+    if cache is None:
+        return lookup()
+    key = cache_key(resolver_name, argument, stack_account_id(stack), region)
+    if not _enabled_setting('UC3_SCEPTRE_CACHE_REFRESH'):
+        hit, value = cache.get(key)
+        if hit:
+            return value
+    value = lookup()
+    cache.put(key, value)
+    return value
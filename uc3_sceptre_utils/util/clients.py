@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Shared boto3 sessions and clients for hooks, resolvers and util functions.
+
+Building a boto3 client loads botocore service models, which is slow, and
+every client carries its own HTTP connection pool.  Clients returned here
+are built once per (service, region, profile, role) and reused for the
+rest of the process.  boto3 clients are thread safe, so sceptre's stack
+threads share them.
+
+When a sceptre 'connection_manager' is passed, its session (and so the
+stack's profile and sceptre_role) is used, and its region, profile and
+role are the defaults for the lookup key.
+
+Clients of rate limited services (see util/ratelimit.py) share a request
+rate per service and account, and calls are recorded when instrumentation
+is enabled (see util/metrics.py).
+"""
+import threading
+
+import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, CredentialResolver, RefreshableCredentials
+from uc3_sceptre_utils.util import DEFAULT_REGION, metrics, ratelimit
+
+# large enough for sceptre's default number of stack threads
+MAX_POOL_CONNECTIONS = 50
+
+CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    retries={'mode': 'standard'},
+)
+
+_lock = threading.RLock()
+_sessions = {}
+_clients = {}
+_resources = {}
+_account_ids = {}
+
+
+def stack_connection_manager(stack):
+    """
+    Return the connection manager of a sceptre stack, or None when running
+    outside of sceptre (e.g. a hook's main()).
+    """
+    return getattr(stack, 'connection_manager', None)
+
+
+def session_key(region=None, profile=None, role=None, connection_manager=None):
+    """
+    Return the (region, profile, role) a session for these arguments uses.
+    """
+    if connection_manager is not None:
+        region = region or connection_manager.region
+        profile = profile or connection_manager.profile
+        role = role or connection_manager.sceptre_role
+    return (region or DEFAULT_REGION, profile, role)
+
+
+class _AssumeRoleProvider(CredentialProvider):
+    """
+    Credentials of an assumed role, assumed again by botocore shortly
+    before they expire, so sessions and clients cached for the whole
+    process keep working past the role's session duration.
+    """
+    METHOD = 'uc3-sceptre-utils-assume-role'
+
+    def __init__(self, region, profile, role):
+        super(_AssumeRoleProvider, self).__init__()
+        self.role = role
+        self.sts_client = boto3.Session(profile_name=profile, region_name=region).client('sts')
+
+    def _assume_role(self):
+        credentials = self.sts_client.assume_role(
+            RoleArn=self.role,
+            RoleSessionName='uc3-sceptre-utils',
+        )['Credentials']
+        return dict(
+            access_key=credentials['AccessKeyId'],
+            secret_key=credentials['SecretAccessKey'],
+            token=credentials['SessionToken'],
+            expiry_time=credentials['Expiration'].isoformat(),
+        )
+
+    def load(self):
+        return RefreshableCredentials.create_from_metadata(
+            self._assume_role(), self._assume_role, self.METHOD)
+
+
+def _assume_role_session(region, profile, role):
+    botocore_session = botocore.session.Session()
+    botocore_session.register_component(
+        'credential_provider',
+        CredentialResolver([_AssumeRoleProvider(region, profile, role)]),
+    )
+    return boto3.Session(botocore_session=botocore_session, region_name=region)
+
+
+def get_session(region=None, profile=None, role=None, connection_manager=None):
+    """
+    Return the boto3 session for (region, profile, role).
+    """
+    key = session_key(region, profile, role, connection_manager)
+    region, profile, role = key
+    if connection_manager is not None:
+        # sceptre caches its sessions for the rest of the run
+        session = connection_manager.get_session(profile, region, role)
+        metrics.attach_session(session)
+        return session
+    with _lock:
+        if key not in _sessions:
+            if role:
+                _sessions[key] = _assume_role_session(region, profile, role)
+            else:
+                _sessions[key] = boto3.Session(
+                    profile_name=profile, region_name=region
+                )
+            metrics.attach_session(_sessions[key])
+        return _sessions[key]
+
+
+def get_client(service, region=None, profile=None, role=None, connection_manager=None):
+    """
+    Return a shared boto3 client for 'service'.
+    """
+    key = (service,) + session_key(region, profile, role, connection_manager)
+    session = get_session(*key[1:], connection_manager=connection_manager)
+    account_id = None
+    if ratelimit.is_limited(service):
+        account_id = get_account_id(*key[1:], connection_manager=connection_manager)
+    with _lock:
+        if key not in _clients:
+            client = session.client(service, config=CLIENT_CONFIG)
+            ratelimit.attach(client, service, account_id)
+            _clients[key] = client
+        return _clients[key]
+
+
+def get_resource(service, region=None, profile=None, role=None, connection_manager=None):
+    """
+    Return a boto3 resource for 'service'.  Resources are not thread safe,
+    so each thread gets its own.
+    """
+    key = (service,) + session_key(region, profile, role, connection_manager)
+    session = get_session(*key[1:], connection_manager=connection_manager)
+    key += (threading.get_ident(),)
+    with _lock:
+        if key not in _resources:
+            resource = session.resource(service, config=CLIENT_CONFIG)
+            if ratelimit.is_limited(service):
+                ratelimit.attach(resource.meta.client, service,
+                                 get_account_id(*key[1:4], connection_manager=connection_manager))
+            _resources[key] = resource
+        return _resources[key]
+
+
+def get_account_id(region=None, profile=None, role=None, connection_manager=None):
+    """
+    Return the Id of the AWS account the session authenticates to.  Looked
+    up once per session.
+    """
+    key = session_key(region, profile, role, connection_manager)
+    if key not in _account_ids:
+        sts_client = get_client('sts', *key, connection_manager=connection_manager)
+        account_id = sts_client.get_caller_identity()['Account']
+        with _lock:
+            _account_ids.setdefault(key, account_id)
+    return _account_ids[key]
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from uc3_sceptre_utils.util import clients
+
+# EC2 accepts at most 200 values per filter
+MAX_FILTER_VALUES = 200
+
+
+class SecurityGroupIndex(object):
+    """
+    Batched lookup of security group ids by name.
+
+    Names are registered up front (see 'register()'), and the first lookup
+    for a (session, VPC) fetches every pending name with one paginated
+    describe_security_groups call.  Groups found are kept for the rest of
+    the process.  Names not found are not: they are fetched again by their
+    own lookup, as the group may be created by a stack launched meanwhile.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (region, profile, role, vpc_id) -> set of names not yet fetched
+        self._pending = {}
+        # (region, profile, role, vpc_id) -> {name: [(group id, vpc id)]}
+        self._groups = {}
+
+    def _key(self, vpc_id, region, connection_manager):
+        return clients.session_key(
+            region, connection_manager=connection_manager) + (vpc_id,)
+
+    def register(self, sg_name, vpc_id=None, region=None, connection_manager=None):
+        """
+        Add 'sg_name' to the names fetched by the next lookup.
+        """
+        key = self._key(vpc_id, region, connection_manager)
+        with self._lock:
+            if sg_name not in self._groups.get(key, {}):
+                self._pending.setdefault(key, set()).add(sg_name)
+
+    def _fetch(self, names, vpc_id, region, connection_manager):
+        ec2_client = clients.get_client(
+            'ec2', region, connection_manager=connection_manager)
+        paginator = ec2_client.get_paginator('describe_security_groups')
+        names = sorted(names)
+        groups = dict((name, []) for name in names)
+        for i in range(0, len(names), MAX_FILTER_VALUES):
+            filters = [dict(Name='group-name', Values=names[i:i + MAX_FILTER_VALUES])]
+            if vpc_id:
+                filters.append(dict(Name='vpc-id', Values=[vpc_id]))
+            for page in paginator.paginate(Filters=filters):
+                for sg in page['SecurityGroups']:
+                    groups[sg['GroupName']].append((sg['GroupId'], sg.get('VpcId')))
+        return groups
+
+    def lookup(self, sg_name, vpc_id=None, region=None, connection_manager=None):
+        """
+        Return the security group id for 'sg_name', or None if not found.
+
+        :raises: RuntimeError, if 'sg_name' matches groups in more than one
+                 VPC and no 'vpc_id' is given.
+        """
+        key = self._key(vpc_id, region, connection_manager)
+        with self._lock:
+            groups = self._groups.setdefault(key, {})
+            if sg_name not in groups:
+                names = self._pending.pop(key, set()) | {sg_name}
+                fetched = self._fetch(
+                    names.difference(groups), vpc_id, region, connection_manager)
+                groups.update((name, matches) for name, matches in fetched.items() if matches)
+            matches = groups.get(sg_name, [])
+        if len(matches) > 1:
+            raise RuntimeError(
+                'Found security groups named "{}" in multiple VPCs: {}.  '
+                'Specify a VPC Id.'.format(sg_name, sorted(m[1] for m in matches))
+            )
+        if len(matches) < 1:
+            return None
+        return matches[0][0]
+
+
+_security_group_index = SecurityGroupIndex()
+
+
+def register_security_group_name(sg_name, vpc_id=None, region=None,
+                                 connection_manager=None):
+    """
+    Queue 'sg_name' so it is fetched together with other pending names.
+    """
+    _security_group_index.register(sg_name, vpc_id, region, connection_manager)
+
+
+def get_security_group_id(sg_name, vpc_id=None, region=None, connection_manager=None):
+    """
+    Return the Id of the security group named 'sg_name', or None.
+    Restrict the search to 'vpc_id' if given.
+    """
+    return _security_group_index.lookup(sg_name, vpc_id, region, connection_manager)
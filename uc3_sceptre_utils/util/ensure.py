@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Run-once, single-flight execution of "ensure" style hooks.
+
+Hooks that make sure something exists (an IAM role, an ECS cluster, a
+hosted zone) are attached to many stacks, and sceptre runs stacks in
+parallel threads.  ensure() runs the work of such a hook once per
+(hook, account, region, argument) in a process: the first caller does
+the work, concurrent callers wait for it and get its result (or its
+exception), and later callers get the memoized result.  Failures are not
+memoized, so a later caller tries again.
+
+Results can also be kept across sceptre processes by setting
+UC3_SCEPTRE_ENSURE_CACHE, either to a file path or to "1" for
+'.uc3-sceptre-ensure.json' in the sceptre project directory.
+
+:UC3_SCEPTRE_ENSURE_TTL:  seconds a persisted result is reused (default 1 hour)
+"""
+import os
+import threading
+
+from uc3_sceptre_utils.util import cache, clients
+
+ENSURE_CACHE_FILENAME = '.uc3-sceptre-ensure.json'
+ENSURE_TTL = int(os.environ.get('UC3_SCEPTRE_ENSURE_TTL', 3600))
+
+_lock = threading.Lock()
+# key -> _Flight of the caller doing the work
+_flights = {}
+# key -> result of work that succeeded
+_results = {}
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def ensure_key(hook_name, argument, stack):
+    connection_manager = clients.stack_connection_manager(stack)
+    region = clients.session_key(connection_manager=connection_manager)[0]
+    account_id = clients.get_account_id(connection_manager=connection_manager)
+    return cache.cache_key('ensure:' + hook_name, str(argument), account_id, region)
+
+
+def _get_store(stack):
+    return cache.get_cache(stack, 'UC3_SCEPTRE_ENSURE_CACHE',
+                           ENSURE_CACHE_FILENAME, ENSURE_TTL)
+
+
+def ensure(hook_name, argument, stack, work):
+    """
+    Return the result of 'work()', calling it at most once at a time, and
+    only until it succeeds, per (hook_name, account, region, argument).
+    The account and region are those of the stack's session.
+    """
+    key = ensure_key(hook_name, argument, stack)
+    with _lock:
+        if key in _results:
+            return _results[key]
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        store = _get_store(stack)
+        hit, result = store.get(key) if store is not None else (False, None)
+        if not hit:
+            result = work()
+            if store is not None and result:
+                store.put(key, result)
+        flight.result = result
+        with _lock:
+            _results[key] = result
+        return result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def forget(hook_name=None):
+    """
+    Drop the memoized results of 'hook_name', or of every hook.  Persisted
+    results expire with UC3_SCEPTRE_ENSURE_TTL.
+    """
+    prefix = 'ensure:' + hook_name + '|' if hook_name else 'ensure:'
+    with _lock:
+        for key in [k for k in _results if k.startswith(prefix)]:
+            del _results[key]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Expiry policy of the in-memory listings behind the route53 and ACM
+indexes.
+
+A listing (all hosted zones, or all certificates, of one account and
+region) is loaded once and answers every lookup until it is 'ttl'
+seconds old.  A lookup that finds nothing reloads it early, if it is at
+least 'miss_reload_age' seconds old: resources created by stacks
+launched earlier in the same sceptre run are then found, while repeated
+misses do not re-list on every lookup.
+"""
+import threading
+import time
+
+# seconds a listing is at least kept when a lookup misses
+MISS_RELOAD_AGE = 10
+
+
+class ListingCache(object):
+    """
+    Thread safe listings by key, loaded on demand and expired as above.
+    """
+
+    def __init__(self, ttl, miss_reload_age=MISS_RELOAD_AGE):
+        self.ttl = ttl
+        self.miss_reload_age = miss_reload_age
+        self._lock = threading.Lock()
+        # key -> (load time, listing)
+        self._listings = {}
+
+    def get(self, key, load, found=None):
+        """
+        Return the listing for 'key', calling load() for a new one if there
+        is none or it expired.  If 'found' is given and found(listing) is
+        false, the listing is loaded again when old enough for a miss.
+        """
+        with self._lock:
+            entry = self._listings.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl or (
+                    found is not None and not found(entry[1])
+                    and time.monotonic() - entry[0] > self.miss_reload_age):
+                entry = self._listings[key] = (time.monotonic(), load())
+            return entry[1]
+
+    def invalidate(self, match=None):
+        """
+        Drop the listings whose key satisfies 'match', or all of them.
+        """
+        with self._lock:
+            for key in [k for k in self._listings if match is None or match(k)]:
+                del self._listings[key]
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the AWS calls made by uc3_sceptre_utils.
+
+When enabled, every API call made with a session from util/clients.py
+(including clients sceptre's connection manager creates from the same
+session afterwards) is recorded with its latency, retries, throttles
+and bytes sent and received.  Calls are grouped by service, operation,
+and the hook or resolver and stack making them (see scoped()).  At exit
+a JSON summary is written and, optionally, a table printed to stderr.
+
+:UC3_SCEPTRE_METRICS:        path of the JSON summary, or "-" for stderr.
+                             Unset (the default) disables instrumentation.
+:UC3_SCEPTRE_METRICS_TABLE:  set to "1" to also print a table to stderr.
+
+When disabled, scoped() and bind() return their function unchanged and
+no botocore event handlers are registered.
+"""
+import atexit
+import collections
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+from uc3_sceptre_utils.util import ratelimit
+
+METRICS_PATH = os.environ.get('UC3_SCEPTRE_METRICS', '')
+METRICS_TABLE = os.environ.get('UC3_SCEPTRE_METRICS_TABLE', '').lower() in ('1', 'true', 'yes')
+ENABLED = bool(METRICS_PATH) or METRICS_TABLE
+# table rows printed, slowest first
+TABLE_ROWS = 30
+
+UNSCOPED = ('-', '-')
+
+# (caller, stack name) of the running hook or resolver
+_scope = contextvars.ContextVar('uc3_sceptre_utils_metrics_scope', default=UNSCOPED)
+
+_lock = threading.Lock()
+# (stack, caller, service, operation) -> counters
+_calls = collections.defaultdict(lambda: dict(
+    calls=0, errors=0, seconds=0.0, max_seconds=0.0, retries=0, throttles=0,
+    bytes_sent=0, bytes_received=0,
+))
+_sessions = set()
+_started = time.time()
+
+
+def scoped(method):
+    """
+    Decorate a hook's run() or a resolver's resolve() (or setup()) so AWS
+    calls made while it runs are attributed to its class and stack.
+    """
+    if not ENABLED:
+        return method
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stack_name = getattr(getattr(self, 'stack', None), 'name', None) or '-'
+        token = _scope.set((type(self).__name__, stack_name))
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _scope.reset(token)
+    return wrapper
+
+
+def bind(func):
+    """
+    Return 'func' bound to the current scope, for running on a thread
+    pool, whose threads do not inherit it.
+    """
+    if not ENABLED:
+        return func
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def _before_call(model, context, **kwargs):
+    context['uc3_metrics'] = dict(
+        scope=_scope.get(), service=model.service_model.service_name, operation=model.name,
+        streaming=model.has_streaming_output or model.has_event_stream_output,
+        start=time.perf_counter(), attempts=0, throttles=0, bytes_sent=0, bytes_received=0,
+    )
+
+
+def _before_send(request, **kwargs):
+    call = (getattr(request, 'context', None) or {}).get('uc3_metrics')
+    if call is None:
+        return
+    length = request.headers.get('Content-Length')
+    if length is not None:
+        call['bytes_sent'] += int(length)
+    elif isinstance(request.body, (bytes, bytearray, str)):
+        call['bytes_sent'] += len(request.body)
+
+
+def _needs_retry(response=None, request_dict=None, **kwargs):
+    call = request_dict and request_dict.get('context', {}).get('uc3_metrics')
+    if call is None:
+        return
+    call['attempts'] += 1
+    if response is not None:
+        length = response[0].headers.get('content-length')
+        if length is not None:
+            call['bytes_received'] += int(length)
+        elif not call['streaming']:
+            # already read, to be parsed
+            call['bytes_received'] += len(response[0].content)
+        if ratelimit.is_throttled(response):
+            call['throttles'] += 1
+
+
+def _record(context, error):
+    call = context.get('uc3_metrics')
+    if call is None:
+        return
+    elapsed = time.perf_counter() - call['start']
+    caller, stack_name = call['scope']
+    key = (stack_name, caller, call['service'], call['operation'])
+    with _lock:
+        counters = _calls[key]
+        counters['calls'] += 1
+        counters['errors'] += int(error)
+        counters['seconds'] += elapsed
+        counters['max_seconds'] = max(counters['max_seconds'], elapsed)
+        counters['retries'] += max(call['attempts'] - 1, 0)
+        counters['throttles'] += call['throttles']
+        counters['bytes_sent'] += call['bytes_sent']
+        counters['bytes_received'] += call['bytes_received']
+
+
+def _after_call(http_response, context, **kwargs):
+    # error responses (ClientError) are emitted as after-call too
+    _record(context, http_response.status_code >= 300)
+
+
+def _after_call_error(context, **kwargs):
+    # requests that got no response, e.g. connection errors
+    _record(context, True)
+
+
+def attach_session(session):
+    """
+    Register the instrumentation handlers on a boto3 session, once.
+    Clients created from it afterwards are instrumented.
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        if id(session) in _sessions:
+            return
+        _sessions.add(id(session))
+    events = session.events
+    events.register('before-call', _before_call)
+    events.register('before-send', _before_send)
+    events.register('needs-retry', _needs_retry)
+    events.register('after-call', _after_call)
+    events.register('after-call-error', _after_call_error)
+
+
+def summary():
+    """
+    Return the recorded calls as a JSON serializable dict.
+    """
+    with _lock:
+        calls = [dict(stack=key[0], caller=key[1], service=key[2], operation=key[3], **counters)
+                 for key, counters in sorted(_calls.items())]
+    totals = dict((name, sum(c[name] for c in calls)) for name in (
+        'calls', 'errors', 'seconds', 'retries', 'throttles', 'bytes_sent', 'bytes_received'))
+    rate_limits = [dict(service=key[0], account=key[1], **stats)
+                   for key, stats in sorted(ratelimit.stats().items())]
+    return dict(
+        started=_started,
+        elapsed=time.time() - _started,
+        totals=totals,
+        calls=calls,
+        rate_limits=rate_limits,
+    )
+
+
+def format_table(report, rows=TABLE_ROWS):
+    columns = ('stack', 'caller', 'service', 'operation', 'calls', 'seconds',
+               'max_seconds', 'retries', 'throttles', 'bytes_received')
+    calls = sorted(report['calls'], key=lambda c: -c['seconds'])[:rows]
+    cells = [[c[name] if not isinstance(c[name], float) else '{:.3f}'.format(c[name])
+              for name in columns] for c in calls]
+    widths = [max([len(name)] + [len(str(row[i])) for row in cells])
+              for i, name in enumerate(columns)]
+    lines = ['  '.join(name.ljust(width) for name, width in zip(columns, widths))]
+    for row in cells:
+        lines.append('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
+    totals = report['totals']
+    lines.append('{} AWS calls, {:.3f}s, {} retries, {} throttles in {:.1f}s'.format(
+        totals['calls'], totals['seconds'], totals['retries'], totals['throttles'],
+        report['elapsed']))
+    return '\n'.join(lines)
+
+
+def write_report():
+    """
+    Write the JSON summary and table, as configured.  Run at exit.
+    """
+    report = summary()
+    if METRICS_PATH == '-':
+        json.dump(report, sys.stderr, indent=1)
+        sys.stderr.write('\n')
+    elif METRICS_PATH:
+        with open(os.path.expanduser(METRICS_PATH), 'w') as f:
+            json.dump(report, f, indent=1)
+    if METRICS_TABLE:
+        sys.stderr.write(format_table(report) + '\n')
+
+
+if ENABLED:
+    atexit.register(write_report)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Polling with jittered exponential backoff and an overall deadline.
+
+Used in place of fixed sleep loops when waiting for AWS to finish
+something, so a fast result is seen quickly and a slow one does not
+spend API quota on checks every few seconds.
+"""
+import collections
+import random
+import time
+
+PollStats = collections.namedtuple('PollStats', ['attempts', 'elapsed', 'slept'])
+
+
+class PollTimeout(RuntimeError):
+    """
+    Raised when the deadline passes before the check succeeds.  'value'
+    holds the last value the check returned.
+    """
+
+    def __init__(self, message, value, stats):
+        super(PollTimeout, self).__init__(message)
+        self.value = value
+        self.stats = stats
+
+
+def backoff_delays(delay=1.0, max_delay=30.0, factor=2.0, jitter=0.5):
+    """
+    Yield sleep times growing from 'delay' by 'factor' up to 'max_delay'.
+    Each is shortened by a random fraction of up to 'jitter', so callers
+    polling at the same time spread out.
+    """
+    while True:
+        yield delay * (1 - random.uniform(0, jitter))
+        delay = min(delay * factor, max_delay)
+
+
+def poll(check, timeout=300, delay=1.0, max_delay=30.0, factor=2.0, jitter=0.5,
+         first_check_immediately=True, done=bool):
+    """
+    Call 'check()' until 'done(value)' is true, and return (value, PollStats).
+
+    :timeout:                  Overall deadline in seconds.
+    :first_check_immediately:  Check before the first sleep.
+    :raises:                   PollTimeout, if the deadline passes first.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    attempts = 0
+    slept = 0.0
+    delays = backoff_delays(delay, max_delay, factor, jitter)
+    if not first_check_immediately:
+        pause = min(next(delays), timeout)
+        time.sleep(pause)
+        slept += pause
+    while True:
+        value = check()
+        attempts += 1
+        remaining = deadline - time.monotonic()
+        stats = PollStats(attempts, time.monotonic() - start, slept)
+        if done(value):
+            return value, stats
+        if remaining <= 0:
+            raise PollTimeout(
+                'gave up after {} checks in {:.1f}s'.format(attempts, stats.elapsed),
+                value, stats,
+            )
+        pause = min(next(delays), remaining)
+        time.sleep(pause)
+        slept += pause
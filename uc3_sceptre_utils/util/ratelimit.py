@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Client-side rate limiting of AWS API requests.
+
+Route53 allows about 5 requests per second per account, and ACM's
+describe and list calls are limited too.  With many sceptre stacks
+running in parallel, each throttled call backing off on its own makes a
+run much slower.  Instead, every request of a limited service waits for
+a token from a bucket shared by all threads using that (service,
+account).  A bucket halves its rate when AWS throttles a request anyway
+and recovers gradually as requests succeed.
+
+Clients from util/clients.py are limited automatically, through
+botocore's 'before-send' and 'needs-retry' events, so each attempt,
+retries included, takes a token.
+
+:UC3_SCEPTRE_RATE_LIMITS:  requests per second by service, e.g.
+                           "route53=5,acm=8,ec2=20".  Services not listed
+                           are not limited.  Set to "off" to disable.
+                           sts cannot be limited: buckets are per account,
+                           and the account is looked up with sts.
+"""
+import os
+import threading
+import time
+
+DEFAULT_RATE_LIMITS = 'route53=5,acm=8'
+# error codes AWS uses for throttled requests
+THROTTLE_CODES = (
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'PriorRequestNotComplete',
+    'RequestLimitExceeded',
+    'SlowDown',
+)
+# a throttle multiplies the rate by this, down to MIN_RATE_FACTOR of the
+# configured rate; each success adds RECOVERY_FACTOR of the configured rate
+BACKOFF_FACTOR = 0.5
+MIN_RATE_FACTOR = 0.1
+RECOVERY_FACTOR = 0.05
+
+
+def parse_rate_limits(setting):
+    """
+    Return {service: requests per second} from a "service=rate,..." string.
+
+    :raises: ValueError, if 'sts' is listed.
+    """
+    if setting.strip().lower() in ('', 'off', '0', 'false', 'no'):
+        return {}
+    limits = {}
+    for item in setting.split(','):
+        service, rate = item.split('=')
+        service = service.strip()
+        if service == 'sts':
+            raise ValueError('UC3_SCEPTRE_RATE_LIMITS: sts cannot be rate limited, '
+                             'it is used to find the account of a rate limit')
+        limits[service] = float(rate)
+    return limits
+
+
+RATE_LIMITS = parse_rate_limits(
+    os.environ.get('UC3_SCEPTRE_RATE_LIMITS', DEFAULT_RATE_LIMITS))
+
+
+class TokenBucket(object):
+    """
+    A thread safe token bucket refilled at 'rate' tokens per second,
+    holding at most 'burst' tokens.  The rate adapts to throttling between
+    MIN_RATE_FACTOR * rate and rate.
+
+    The default burst of one token spaces requests 1 / rate apart, so no
+    one second window ever holds more than 'rate' of them: AWS limits are
+    per second, and a full bucket of 'rate' tokens would allow twice that
+    in the first second.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.waits = 0
+        self.waited = 0.0
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Take a token, sleeping until one is available.  Return the seconds
+        slept.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            # take the token now, going into debt, so waiting threads are
+            # served in turn without holding the lock while they sleep
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.requests += 1
+            if wait:
+                self.waits += 1
+                self.waited += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self):
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.max_rate * MIN_RATE_FACTOR, self.rate * BACKOFF_FACTOR)
+
+    def succeeded(self):
+        if self.rate < self.max_rate:
+            with self._lock:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FACTOR)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                requests=self.requests,
+                waits=self.waits,
+                waited=round(self.waited, 3),
+                throttles=self.throttles,
+                rate=self.rate,
+                max_rate=self.max_rate,
+            )
+
+
+_lock = threading.Lock()
+# (service, account) -> TokenBucket
+_buckets = {}
+
+
+def is_limited(service):
+    return service in RATE_LIMITS
+
+
+def get_bucket(service, account):
+    key = (service, account)
+    with _lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(RATE_LIMITS[service])
+        return _buckets[key]
+
+
+def is_throttled(response):
+    """
+    Return True if a botocore (http response, parsed) pair is a throttle.
+    """
+    if response is None:
+        return False
+    error = response[1].get('Error', {})
+    return error.get('Code') in THROTTLE_CODES or response[0].status_code == 429
+
+
+def attach(client, service, account):
+    """
+    Make every request of 'client' take a token from the bucket of
+    (service, account), if the service is limited.
+    """
+    if not is_limited(service):
+        return
+    bucket = get_bucket(service, account)
+    event_name = client.meta.service_model.service_id.hyphenize()
+
+    def before_send(**kwargs):
+        bucket.acquire()
+
+    def needs_retry(response=None, **kwargs):
+        if is_throttled(response):
+            bucket.throttled()
+        elif response is not None and response[0].status_code < 300:
+            bucket.succeeded()
+
+    events = client.meta.events
+    events.register('before-send.' + event_name, before_send)
+    events.register('needs-retry.' + event_name, needs_retry)
+
+
+def stats():
+    """
+    Return {(service, account): counters} for every bucket used so far:
+    requests, waits (requests that had to wait), waited (seconds),
+    throttles, and the current and configured rate.
+    """
+    with _lock:
+        buckets = dict(_buckets)
+    return dict((key, bucket.stats()) for key, bucket in buckets.items())
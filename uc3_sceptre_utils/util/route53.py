@@ -1,77 +1,206 @@
 # -*- coding: utf-8 -*-
-import boto3
-from uc3_sceptre_utils.util import DEFAULT_REGION
+import itertools
+import os
+import threading
+
+from uc3_sceptre_utils.util import DEFAULT_REGION, clients, listing
 
 import json
 
-def get_hosted_zone_id(domain_name, region=DEFAULT_REGION):
+# seconds the hosted zones of an account are served from memory, see
+# util/listing.py
+HOSTED_ZONE_INDEX_TTL = int(os.environ.get('UC3_SCEPTRE_HOSTED_ZONE_TTL', 900))
+
+# limits of a single change_resource_record_sets request
+MAX_BATCH_RECORDS = 1000
+MAX_BATCH_CHARACTERS = 32000
+# waiting for changes to reach INSYNC
+CHANGE_WAIT_DELAY = 10
+CHANGE_WAIT_TIMEOUT = 300
+
+
+def normalize_zone_name(domain_name):
     """
-    Return hostedZoneId for a public hosted zone corresponding to 'domain_name'.
+    Return 'domain_name' in the form route53 uses for zone names:
+    lower case with a trailing dot.
     """
-    route53_client = boto3.client('route53', region_name=region)
-    response = route53_client.list_hosted_zones()
-    hosted_zones = response["HostedZones"]
-    while response["IsTruncated"]:
-        response = route53_client.list_hosted_zones(
-            Marker=response["NextMarker"]
-        )
-        hosted_zones += response["HostedZones"]
+    domain_name = domain_name.lower()
     if not domain_name.endswith("."):
         domain_name += "."
-    hosted_zone_ids = [
-        zone['Id'] for zone in hosted_zones if (
-            zone['Name'] == domain_name and zone['Config']['PrivateZone'] == False
+    return domain_name
+
+
+class HostedZoneIndex(object):
+    """
+    Process-wide index of route53 hosted zones.
+
+    The zone list is paged through once per (account, region) and stored
+    by (normalized zone name, private zone flag), so every later lookup is
+    a dict hit.  Listings expire as described in util/listing.py, and can
+    be dropped early with 'invalidate()' (e.g. after creating a hosted
+    zone).
+    """
+
+    def __init__(self, ttl=HOSTED_ZONE_INDEX_TTL, miss_reload_age=listing.MISS_RELOAD_AGE):
+        self._zones = listing.ListingCache(ttl, miss_reload_age)
+
+    def _load(self, region, connection_manager):
+        route53_client = clients.get_client(
+            'route53', region, connection_manager=connection_manager)
+        paginator = route53_client.get_paginator('list_hosted_zones')
+        zones = {}
+        for page in paginator.paginate():
+            for zone in page["HostedZones"]:
+                key = (normalize_zone_name(zone['Name']), zone['Config']['PrivateZone'])
+                # keep the first zone listed, as the linear scan used to
+                zones.setdefault(key, zone['Id'].split("/")[2])
+        return zones
+
+    def lookup(self, domain_name, private_zone=False, region=DEFAULT_REGION,
+               connection_manager=None):
+        """
+        Return the hosted zone Id for 'domain_name', or None.
+        """
+        account_id = clients.get_account_id(region, connection_manager=connection_manager)
+        zone_key = (normalize_zone_name(domain_name), private_zone)
+        zones = self._zones.get(
+            (account_id, region),
+            lambda: self._load(region, connection_manager),
+            lambda zones: zone_key in zones,
         )
-    ]
-    if len(hosted_zone_ids) < 1:
-        return None
-    return hosted_zone_ids[0].split("/")[2]
+        return zones.get(zone_key)
+
+    def invalidate(self, region=None):
+        """
+        Drop loaded zone listings, for 'region' only if given.
+        """
+        self._zones.invalidate(None if region is None else lambda key: key[1] == region)
+
 
+_hosted_zone_index = HostedZoneIndex()
 
-def get_elb_hosted_zone_id(elb_arn):
+
+def get_hosted_zone_id(domain_name, region=DEFAULT_REGION, private_zone=False,
+                       connection_manager=None):
+    """
+    Return hostedZoneId for a public hosted zone corresponding to 'domain_name'.
+    Set 'private_zone' to look up a private hosted zone instead.
+    """
+    return _hosted_zone_index.lookup(
+        domain_name, private_zone, region, connection_manager)
+
+
+def invalidate_hosted_zone_index(region=None):
+    """
+    Forget cached hosted zones so the next lookup lists them again.
+    """
+    _hosted_zone_index.invalidate(region)
+
+
+def get_elb_hosted_zone_id(elb_arn, region=None, connection_manager=None):
     """
     Return the canonical hosted zoned Id of the given loadbalance arn.
     """
-    elb_client = boto3.client('elbv2')
+    elb_client = clients.get_client('elbv2', region, connection_manager=connection_manager)
     response = elb_client.describe_load_balancers(LoadBalancerArns=[elb_arn])
     return response['LoadBalancers'][0]['CanonicalHostedZoneId']
 
 
+def iter_resource_record_sets(
+        hosted_zone_id,
+        start_record_name=None,
+        start_record_type=None,
+        connection_manager=None):
+    """
+    Yield the record sets of a hosted zone in route53's order, starting at
+    'start_record_name' (and 'start_record_type') if given.  Pages are
+    fetched only as the caller consumes them, so a caller that stops early
+    never downloads the rest of the zone.
+    """
+    client = clients.get_client('route53', connection_manager=connection_manager)
+    kwargs = dict(HostedZoneId=hosted_zone_id)
+    if start_record_name:
+        kwargs['StartRecordName'] = start_record_name
+        if start_record_type:
+            kwargs['StartRecordType'] = start_record_type
+    while True:
+        response = client.list_resource_record_sets(**kwargs)
+        for record in response['ResourceRecordSets']:
+            yield record
+        if not response.get('IsTruncated'):
+            return
+        kwargs['StartRecordName'] = response['NextRecordName']
+        kwargs['StartRecordType'] = response['NextRecordType']
+        if 'NextRecordIdentifier' in response:
+            kwargs['StartRecordIdentifier'] = response['NextRecordIdentifier']
+        else:
+            kwargs.pop('StartRecordIdentifier', None)
+
+
+def iter_record_sets_under(
+        hosted_zone_id,
+        domain_name,
+        record_type=None,
+        connection_manager=None):
+    """
+    Yield the record sets named 'domain_name' or any name below it.
+
+    route53 lists records sorted by their labels in reverse order
+    (com.example.www), so a name and everything below it are listed
+    together.  The listing starts at 'domain_name' and stops at the first
+    name outside it.
+    """
+    domain_name = normalize_zone_name(domain_name)
+    records = iter_resource_record_sets(
+        hosted_zone_id, domain_name, connection_manager=connection_manager)
+    for record in records:
+        name = normalize_zone_name(record['Name'])
+        if name != domain_name and not name.endswith('.' + domain_name):
+            return
+        if record_type is None or record['Type'] == record_type:
+            yield record
+
+
 def get_resource_record_set(
         hosted_zone,
         record_type=None,
         pattern=None,
-        domain_name=None):
+        domain_name=None,
+        connection_manager=None,
+        under=None):
     """
     Return route53 resource_record_set by name.
 
     :domain_name:
     :hosted_zone: domainname of the route53 hosted zone to query
+    :under:       with 'pattern', only look at names at or below this name
+                  rather than the whole zone
     """
+    hosted_zone_id = get_hosted_zone_id(
+        hosted_zone, connection_manager=connection_manager)
 
-    # collect all record sets in hosted zone
-    client = boto3.client('route53')
-    hosted_zone_id = get_hosted_zone_id(hosted_zone)
-    response = client.list_resource_record_sets(HostedZoneId=hosted_zone_id)
-    records = response['ResourceRecordSets']
-    if 'IsTruncated' in response:
-        while response['IsTruncated']:
-            response = client.list_resource_record_sets(
-                HostedZoneId=hosted_zone_id,
-                StartRecordName=response['NextRecordName'],
-                StartRecordType=response['NextRecordType'],
-            )
-            records.append(response['ResourceRecordSets'])
-
-    # filter for record set Type
-    if record_type:
-        records = [r for r in records if r['Type'] == record_type]
-
-    # filter for domain_name or pattern
+    # seek to the records that can match instead of listing the zone
     if domain_name:
-        records = [r for r in records if r['Name'] == domain_name]
+        domain_name = normalize_zone_name(domain_name)
+        candidates = itertools.takewhile(
+            lambda r: normalize_zone_name(r['Name']) == domain_name,
+            iter_resource_record_sets(
+                hosted_zone_id, domain_name, record_type, connection_manager),
+        )
+        records = [
+            r for r in candidates if record_type is None or r['Type'] == record_type
+        ]
     elif pattern:
-        records = [r for r in records if pattern.match(r['Name'])]
+        if under:
+            candidates = iter_record_sets_under(
+                hosted_zone_id, under, record_type, connection_manager)
+        else:
+            candidates = (
+                r for r in iter_resource_record_sets(
+                    hosted_zone_id, connection_manager=connection_manager)
+                if record_type is None or r['Type'] == record_type
+            )
+        records = [r for r in candidates if pattern.match(r['Name'])]
     else:
         raise ValueError("must supply either 'domain_name' or 'pattern'")
     if len(records) == 0:
@@ -81,30 +210,143 @@ def get_resource_record_set(
     return records
 
 
+def _change_size(change):
+    """
+    Return (records, characters) 'change' counts toward route53's batch
+    limits.  UPSERT counts twice.
+    """
+    record_set = change['ResourceRecordSet']
+    values = [r['Value'] for r in record_set.get('ResourceRecords', [])]
+    weight = 2 if change['Action'] == 'UPSERT' else 1
+    return weight * max(len(values), 1), weight * sum(len(v) for v in values)
+
+
+class ChangeBatch(object):
+    """
+    Collects route53 record set changes, from any number of callers and
+    threads, and submits them with as few API calls as possible: one
+    change_resource_record_sets per hosted zone, split only where a batch
+    would pass route53's limits of MAX_BATCH_RECORDS records or
+    MAX_BATCH_CHARACTERS characters of record values.
+
+    Example:
+
+        batch = ChangeBatch('acm cert validation')
+        for record_set in record_sets:
+            batch.add('UPSERT', record_set, hosted_zone='example.com')
+        batch.submit(wait=True)
+    """
+
+    def __init__(self, comment=str(), region=DEFAULT_REGION, connection_manager=None):
+        self.comment = comment
+        self.region = region
+        self.connection_manager = connection_manager
+        self._lock = threading.Lock()
+        # hosted zone id -> [change]
+        self._changes = {}
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(changes) for changes in self._changes.values())
+
+    def add(self, action, record_set, hosted_zone=None, hosted_zone_id=None):
+        """
+        Queue 'action' on 'record_set' in the zone named 'hosted_zone', or
+        with Id 'hosted_zone_id'.
+        """
+        valid_actions = ('CREATE', 'DELETE', 'UPSERT')
+        if action not in valid_actions:
+            raise ValueError('"action" must be one of {}'.format(valid_actions))
+        if hosted_zone_id is None:
+            hosted_zone_id = get_hosted_zone_id(
+                hosted_zone, self.region, connection_manager=self.connection_manager)
+            if hosted_zone_id is None:
+                raise RuntimeError(
+                    "No Route53 HostedZone matches '{}'".format(hosted_zone))
+        change = {
+            'Action': action,
+            'ResourceRecordSet': record_set,
+        }
+        with self._lock:
+            self._changes.setdefault(hosted_zone_id, []).append(change)
+
+    def _split(self, changes):
+        batch = []
+        records = characters = 0
+        for change in changes:
+            change_records, change_characters = _change_size(change)
+            if batch and (records + change_records > MAX_BATCH_RECORDS
+                          or characters + change_characters > MAX_BATCH_CHARACTERS):
+                yield batch
+                batch = []
+                records = characters = 0
+            batch.append(change)
+            records += change_records
+            characters += change_characters
+        if batch:
+            yield batch
+
+    def submit(self, wait=False, timeout=CHANGE_WAIT_TIMEOUT):
+        """
+        Send all queued changes and empty the batch.  Return the ChangeInfo
+        of every request.  With 'wait', return once route53 reports all of
+        them INSYNC.
+        """
+        with self._lock:
+            changes_by_zone, self._changes = self._changes, {}
+        route53_client = clients.get_client(
+            'route53', self.region, connection_manager=self.connection_manager)
+        change_infos = []
+        for hosted_zone_id, changes in changes_by_zone.items():
+            for batch in self._split(changes):
+                response = route53_client.change_resource_record_sets(
+                    HostedZoneId=hosted_zone_id,
+                    ChangeBatch={
+                        'Comment': self.comment,
+                        'Changes': batch,
+                    },
+                )
+                change_infos.append(response['ChangeInfo'])
+        if wait:
+            waiter = route53_client.get_waiter('resource_record_sets_changed')
+            for change_info in change_infos:
+                waiter.wait(
+                    Id=change_info['Id'],
+                    WaiterConfig=dict(
+                        Delay=CHANGE_WAIT_DELAY,
+                        MaxAttempts=max(1, int(timeout // CHANGE_WAIT_DELAY)),
+                    ),
+                )
+        return change_infos
+
+
 def change_record_set(
         record_set,
         validation_domain,
         action='UPSERT',
         comment=str(),
-        region=DEFAULT_REGION):
+        region=DEFAULT_REGION,
+        connection_manager=None):
     """
     Change route53 record.
     """
-    valid_actions = ('CREATE', 'DELETE', 'UPSERT')
-    if action not in valid_actions:
-        raise ValueError('"action" must be one of {}'.format(valid_actions))
-    route53_client = boto3.client('route53', region_name=region)
-    hosted_zone_id = get_hosted_zone_id(validation_domain, region)
-    change_batch = {
-        'Comment': comment,
-        'Changes': [
-            {
-                'Action': action,
-                'ResourceRecordSet': record_set,
-            }
-        ]
-    }
-    route53_client.change_resource_record_sets(
-        HostedZoneId=hosted_zone_id,
-        ChangeBatch=change_batch,
-    )
+    change_record_sets(
+        [record_set], validation_domain, action, comment, region, connection_manager)
+
+
+def change_record_sets(
+        record_sets,
+        validation_domain,
+        action='UPSERT',
+        comment=str(),
+        region=DEFAULT_REGION,
+        connection_manager=None,
+        wait=False):
+    """
+    Apply 'action' to all of 'record_sets' with as few change batches as
+    route53 allows.  With 'wait', return once the changes are INSYNC.
+    """
+    batch = ChangeBatch(comment, region, connection_manager)
+    for record_set in record_sets:
+        batch.add(action, record_set, hosted_zone=validation_domain)
+    return batch.submit(wait=wait)
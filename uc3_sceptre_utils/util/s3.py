@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+Emptying S3 buckets quickly.
+
+Every object version and delete marker is listed with
+list_object_versions, which also lists the objects of unversioned
+buckets, and removed with DeleteObjects in batches of up to 1000 keys.
+The key space is split into prefixes that are listed in parallel, each
+key is listed once, and deleted as soon as its batch is full, on a
+bounded pool of workers shared by all listings.
+
+Buckets too large to empty that way can instead be given a lifecycle
+configuration that expires everything, leaving the deletion to S3.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from uc3_sceptre_utils.util import clients, metrics, poll
+
+# DeleteObjects accepts at most 1000 keys per request
+MAX_DELETE_KEYS = 1000
+# concurrent DeleteObjects requests.  Must not exceed the client's
+# connection pool (clients.MAX_POOL_CONNECTIONS).
+DELETE_WORKERS = int(os.environ.get('UC3_SCEPTRE_S3_DELETE_WORKERS', 16))
+# prefixes listed at the same time
+LIST_WORKERS = 8
+# aim for this many prefixes listed in parallel, and split prefixes at most
+# this deep to get them
+MIN_SHARDS = 16
+MAX_SHARD_DEPTH = 3
+SHARD_DELIMITER = '/'
+# seconds between progress messages
+PROGRESS_INTERVAL = 10
+# DeleteObjects per-key errors worth retrying, and how often
+RETRY_ERROR_CODES = ('SlowDown', 'InternalError', 'ServiceUnavailable', 'RequestTimeout')
+MAX_KEY_RETRIES = 3
+# per-key errors included in the exception message
+MAX_REPORTED_ERRORS = 10
+
+# lifecycle rules installed by set_expire_all_lifecycle().  Expiration by
+# days and of delete markers cannot share a rule.
+EXPIRE_ALL_RULE_ID = 'uc3-sceptre-utils-expire-all'
+EXPIRE_ALL_RULES = [
+    dict(
+        ID=EXPIRE_ALL_RULE_ID,
+        Filter=dict(Prefix=''),
+        Status='Enabled',
+        Expiration=dict(Days=1),
+        NoncurrentVersionExpiration=dict(NoncurrentDays=1),
+        AbortIncompleteMultipartUpload=dict(DaysAfterInitiation=1),
+    ),
+    dict(
+        ID=EXPIRE_ALL_RULE_ID + '-delete-markers',
+        Filter=dict(Prefix=''),
+        Status='Enabled',
+        Expiration=dict(ExpiredObjectDeleteMarker=True),
+    ),
+]
+# keys listed by count_remaining()
+REMAINING_PROBE_KEYS = 1000
+
+logger = logging.getLogger(__name__)
+
+DeleteError = collections.namedtuple('DeleteError', ['key', 'version_id', 'code', 'message'])
+EmptyResult = collections.namedtuple('EmptyResult', ['deleted', 'errors', 'elapsed'])
+Remaining = collections.namedtuple('Remaining', ['keys', 'truncated', 'uploads', 'expire_all'])
+
+
+class BucketNotEmptied(RuntimeError):
+    """
+    Raised when some keys could not be deleted.  'result' holds the
+    EmptyResult, including every per-key error.
+    """
+
+    def __init__(self, message, result):
+        super(BucketNotEmptied, self).__init__(message)
+        self.result = result
+
+
+class _Progress(object):
+    """
+    Thread safe counts of deleted keys, logged every PROGRESS_INTERVAL
+    seconds with the throughput so far.
+    """
+
+    def __init__(self, bucket_name, log=logger, interval=PROGRESS_INTERVAL):
+        self.bucket_name = bucket_name
+        self.log = log
+        self.interval = interval
+        self.start = time.monotonic()
+        self.deleted = 0
+        self.errors = []
+        self._lock = threading.Lock()
+        self._next_report = self.start + interval
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def add(self, deleted, errors=()):
+        with self._lock:
+            self.deleted += deleted
+            self.errors.extend(errors)
+            now = time.monotonic()
+            if now < self._next_report:
+                return
+            self._next_report = now + self.interval
+            deleted, failed = self.deleted, len(self.errors)
+        self.log.info('{} - {}: deleted {} keys ({:.0f}/s), {} errors'.format(
+            __name__, self.bucket_name, deleted, deleted / self.elapsed, failed))
+
+    def result(self):
+        with self._lock:
+            return EmptyResult(self.deleted, list(self.errors), self.elapsed)
+
+
+def _list_page_keys(page):
+    return [dict(Key=v['Key'], VersionId=v['VersionId'])
+            for v in page.get('Versions', []) + page.get('DeleteMarkers', [])]
+
+
+def _delete_batch(s3_client, bucket_name, keys, progress):
+    """
+    Delete up to MAX_DELETE_KEYS versions, retrying keys that fail with a
+    transient error.  Other per-key errors are added to 'progress'.
+    """
+    delays = poll.backoff_delays()
+    for attempt in range(MAX_KEY_RETRIES + 1):
+        response = s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete=dict(Objects=keys, Quiet=True),
+        )
+        errors = response.get('Errors', [])
+        retry = [e for e in errors if e['Code'] in RETRY_ERROR_CODES]
+        if attempt == MAX_KEY_RETRIES:
+            retry = []
+        failed = [DeleteError(e['Key'], e.get('VersionId'), e['Code'], e.get('Message'))
+                  for e in errors if e not in retry]
+        progress.add(len(keys) - len(errors), failed)
+        if not retry:
+            return
+        keys = [dict(Key=e['Key'], VersionId=e['VersionId']) for e in retry]
+        time.sleep(next(delays))
+
+
+class _DeleteQueue(object):
+    """
+    Keys listed by one thread, queued for deletion on the shared pool of
+    delete workers in batches of MAX_DELETE_KEYS.  The 'pending' semaphore,
+    shared by all queues, bounds the batches waiting for a worker.
+    """
+
+    def __init__(self, s3_client, bucket_name, executor, pending, progress):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.executor = executor
+        self.pending = pending
+        self.progress = progress
+        self.batch = []
+        self.futures = []
+
+    def _submit(self, batch):
+        self.pending.acquire()
+        future = self.executor.submit(metrics.bind(_delete_batch), self.s3_client,
+                                      self.bucket_name, batch, self.progress)
+        future.add_done_callback(lambda f: self.pending.release())
+        self.futures.append(future)
+
+    def add(self, keys):
+        self.batch.extend(keys)
+        while len(self.batch) >= MAX_DELETE_KEYS:
+            self._submit(self.batch[:MAX_DELETE_KEYS])
+            self.batch = self.batch[MAX_DELETE_KEYS:]
+
+    def flush(self):
+        if self.batch:
+            self._submit(self.batch)
+            self.batch = []
+
+    def wait(self):
+        """
+        Wait for the queued batches, re-raising request failures (e.g.
+        AccessDenied).
+        """
+        for future in self.futures:
+            future.result()
+
+
+def _empty_prefix(s3_client, bucket_name, prefix, split, queue):
+    """
+    List the versions and delete markers under 'prefix' and queue them for
+    deletion on 'queue'.  With 'split', list only the keys directly under
+    'prefix' and return the prefixes one level down, to be emptied by
+    further calls; otherwise list everything under 'prefix' and return [].
+    """
+    kwargs = dict(Bucket=bucket_name, Prefix=prefix)
+    if split:
+        kwargs['Delimiter'] = SHARD_DELIMITER
+    paginator = s3_client.get_paginator('list_object_versions')
+    prefixes = []
+    for page in paginator.paginate(**kwargs):
+        queue.add(_list_page_keys(page))
+        prefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+    queue.flush()
+    return prefixes
+
+
+def empty_bucket(bucket_name, region=None, connection_manager=None,
+                 workers=DELETE_WORKERS, min_shards=MIN_SHARDS, max_depth=MAX_SHARD_DEPTH,
+                 log=logger):
+    """
+    Delete every object version and delete marker of a bucket.  Return an
+    EmptyResult of (keys deleted, per-key errors, seconds elapsed).
+
+    The bucket is emptied level by level of SHARD_DELIMITER prefixes: the
+    prefixes of a level are listed in parallel, and their keys deleted as
+    they are listed, until a level has at least 'min_shards' prefixes or
+    'max_depth' is reached.  The prefixes of that last level are then
+    listed recursively, so every key is listed exactly once.
+
+    :raises: BucketNotEmptied, if any key could not be deleted.
+    """
+    s3_client = clients.get_client('s3', region, connection_manager=connection_manager)
+    progress = _Progress(bucket_name, log)
+    pending = threading.BoundedSemaphore(workers * 2)
+    queues = []
+
+    def empty_prefix(prefix, split):
+        queue = _DeleteQueue(s3_client, bucket_name, delete_executor, pending, progress)
+        queues.append(queue)
+        return _empty_prefix(s3_client, bucket_name, prefix, split, queue)
+
+    with ThreadPoolExecutor(max_workers=workers) as delete_executor, \
+            ThreadPoolExecutor(max_workers=LIST_WORKERS) as list_executor:
+        prefixes = ['']
+        depth = 0
+        while prefixes:
+            split = depth < max_depth and len(prefixes) < min_shards
+            log.debug('{} - {}: emptying {} prefixes{}'.format(
+                __name__, bucket_name, len(prefixes), '' if split else ' recursively'))
+            levels = list_executor.map(metrics.bind(empty_prefix), prefixes,
+                                       [split] * len(prefixes))
+            prefixes = [prefix for level in levels for prefix in level]
+            depth += 1
+        for queue in queues:
+            queue.wait()
+
+    result = progress.result()
+    log.info('{} - {}: deleted {} keys in {:.1f}s ({:.0f}/s), {} errors'.format(
+        __name__, bucket_name, result.deleted, result.elapsed,
+        result.deleted / result.elapsed if result.elapsed else 0, len(result.errors)))
+    if result.errors:
+        raise BucketNotEmptied(
+            '{} keys could not be deleted from {}: {}'.format(
+                len(result.errors), bucket_name,
+                '; '.join('{} ({}): {} {}'.format(*e)
+                          for e in result.errors[:MAX_REPORTED_ERRORS])),
+            result,
+        )
+    return result
+
+
+def set_expire_all_lifecycle(bucket_name, region=None, connection_manager=None):
+    """
+    Replace the lifecycle configuration of a bucket with rules expiring
+    every current and noncurrent version, expired delete marker and
+    incomplete multipart upload after a day.  S3 then empties the bucket
+    in the background, typically within a few days, at no request cost.
+    """
+    s3_client = clients.get_client('s3', region, connection_manager=connection_manager)
+    s3_client.put_bucket_lifecycle_configuration(
+        Bucket=bucket_name,
+        LifecycleConfiguration=dict(Rules=EXPIRE_ALL_RULES),
+    )
+
+
+def has_expire_all_lifecycle(bucket_name, region=None, connection_manager=None):
+    """
+    Return True if the bucket has the rules of set_expire_all_lifecycle().
+    """
+    s3_client = clients.get_client('s3', region, connection_manager=connection_manager)
+    try:
+        rules = s3_client.get_bucket_lifecycle_configuration(Bucket=bucket_name)['Rules']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchLifecycleConfiguration':
+            raise
+        return False
+    return EXPIRE_ALL_RULE_ID in [rule.get('ID') for rule in rules]
+
+
+def count_remaining(bucket_name, region=None, connection_manager=None,
+                    max_keys=REMAINING_PROBE_KEYS):
+    """
+    Probe how much is left in a bucket with one ListObjectVersions and one
+    ListMultipartUploads request.  Return Remaining(keys, truncated,
+    uploads, expire_all), where 'keys' counts versions and delete markers
+    up to 'max_keys' ('truncated' is True if there are more), and
+    'expire_all' tells if the expire-all lifecycle rules are in place.
+    """
+    s3_client = clients.get_client('s3', region, connection_manager=connection_manager)
+    versions = s3_client.list_object_versions(Bucket=bucket_name, MaxKeys=max_keys)
+    uploads = s3_client.list_multipart_uploads(Bucket=bucket_name, MaxUploads=max_keys)
+    return Remaining(
+        len(_list_page_keys(versions)),
+        versions.get('IsTruncated', False),
+        len(uploads.get('Uploads', [])),
+        has_expire_all_lifecycle(bucket_name, region, connection_manager),
+    )